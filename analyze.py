@@ -0,0 +1,285 @@
+from __future__ import division, print_function, unicode_literals
+
+"""Monte Carlo analysis of generated levels
+
+    python analyze.py [--seeds N] [--first S] [--processes P] [--csv PATH]
+                      [--rings R] [--ring-spacing D] [--specials K] [--inner-rings I]
+
+builds the first level of a flysim.Simulation for every seed, has a Bot play
+it headless through the same buttons a player has, and reports how many
+layouts were finished, how long they took and how many were dead (a special
+pad no sequence of hops can reach). Seeds are spread over a process pool,
+one worker per core by default; the layout options override flysim.rules in
+every worker so parameters can be tuned before seeds are shipped.
+"""
+
+import sys
+import math
+import time
+import argparse
+import collections
+import multiprocessing
+
+import flysim
+import flymath
+
+# rules the command line may override
+TUNABLE = ('rings', 'ringSpacing', 'numSpecialPads', 'innerRings')
+
+# layout -> {pad index, or None for the start point: [pad index]}; the pads
+# of a layout don't depend on the seed, so each worker builds a graph once
+graphs = {}
+
+
+class Bot(object):
+
+    """
+    Responsibilities:
+        Hop graph: which pad a perfectly aimed hop from each pad lands on
+        Play: steers and hops towards the nearest untriggered special pad
+              over pads that are neither disabled nor spinning
+
+    It drives the sim with set_button only, so it plays by the real rules.
+    """
+
+    tolerance = 2.5  # degrees; one tick of turning is 5
+    restless = 0.6  # seconds on a pad before any safe hop beats waiting
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.neighbours = {}  # pad, or None for the start point -> [pad]
+        self.target = None
+        self.replan = 0.0  # no route was found; look again at this time
+        self.landed = 0.0
+        self.hops = 0
+
+    def on_event(self, event, *args):
+        if event == 'level_built':
+            self.build_graph()
+        elif event == 'hop':
+            self.hops += 1
+            self.landed = self.sim.time + flysim.rules['hopDuration']
+            self.target = None
+
+    def lands_on(self, x, y, ux, uy, exclPad):
+        """pad a hop from (x, y) heading (ux, uy) lands on, or None"""
+        reach = flysim.rules['hopReach']
+        return self.sim.nearestPad(x, y, x + ux * reach, y + uy * reach, reach, exclPad)
+
+    def build_graph(self):
+        sim = self.sim
+        key = (sim.layout, flysim.rules['hopReach'], flysim.rules['hopCone'])
+        if key not in graphs:
+            graphs[key] = self.hop_graph()
+        pads = sim.pads
+        self.neighbours = dict(
+            (None if i is None else pads[i], [pads[j] for j in edges]) for i, edges in graphs[key].items())
+
+    def hop_graph(self):
+        sim = self.sim
+        reach = flysim.rules['hopReach']
+        found = []
+        graph = {}
+        for pad in [None] + sim.pads:
+            x, y = sim.origin if pad is None else (pad.x, pad.y)
+            edges = []
+            for cell in sim.padGrid.cells_around(x, y, 2.0 * reach, found):
+                for other in cell:
+                    if other is pad:
+                        continue
+                    d2 = flymath.dist2(x, y, other.x, other.y)
+                    if d2 == 0.0 or d2 > 4.0 * reach * reach:
+                        continue
+                    d = math.sqrt(d2)
+                    if self.lands_on(x, y, (other.x - x) / d, (other.y - y) / d, pad) is other:
+                        edges.append(other.index)
+            graph[None if pad is None else pad.index] = edges
+        return graph
+
+    def reachable(self):
+        """pads some sequence of hops from the start can land on"""
+        seen = set()
+        queue = collections.deque([None])
+        while queue:
+            for other in self.neighbours[queue.popleft()]:
+                if other not in seen:
+                    seen.add(other)
+                    queue.append(other)
+        return seen
+
+    def plan(self):
+        """first hop of a shortest safe route to an untriggered special pad"""
+        if all(p.specialTriggered for p in self.sim.specialPads):
+            return None  # the last special pad is safe to wait on
+        start = self.sim.player.currentPad
+        first = {}
+        queue = collections.deque([start])
+        while queue:
+            pad = queue.popleft()
+            for other in self.neighbours[pad]:
+                if other is start or other in first or other.disabled or other.spinning:
+                    continue
+                first[other] = first.get(pad, other)
+                if other.special and not other.specialTriggered:
+                    return first[other]
+                queue.append(other)
+        return None
+
+    def turn_to(self, pad):
+        """degrees the player has to turn to face pad, clockwise positive"""
+        player = self.sim.player
+        heading = math.degrees(math.atan2(pad.x - player.x, pad.y - player.y))
+        return (heading - player.rotation + 180.0) % 360.0 - 180.0
+
+    def escape(self):
+        """the quickest safe hop, for when staying put is worse"""
+        best, best_turn = None, 360.0
+        for other in self.neighbours[self.sim.player.currentPad]:
+            if not other.disabled and not other.spinning and abs(self.turn_to(other)) < best_turn:
+                best, best_turn = other, abs(self.turn_to(other))
+        return best
+
+    def control(self):
+        sim = self.sim
+        player = sim.player
+        turn, up = 0, 0
+        if not player.disabled and not player.hopping:
+            pad = player.currentPad
+            waited = sim.time - self.landed
+            target = self.target
+            if (target is None or target.disabled or target.spinning) and sim.time >= self.replan:
+                target = self.target = self.plan()
+                if target is None:
+                    self.replan = sim.time + 0.1
+            if target is None and pad is not None and not pad.special and waited > self.restless:
+                target = self.target = self.escape()
+            if target is not None:
+                error = self.turn_to(target)
+                if error > self.tolerance:
+                    turn = 1
+                elif error < -self.tolerance:
+                    turn = -1
+                elif sim.buttons['up'] == 0:
+                    # turning goes in 5 degree ticks, so the aim may land on
+                    # a neighbour of the target; any pad beats standing still
+                    if self.lands_on(player.x, player.y, sim.impulse_x, sim.impulse_y, pad) is not None:
+                        up = 1
+        sim.set_button('right', turn > 0)
+        sim.set_button('left', turn < 0)
+        sim.set_button('up', up)
+
+
+def play_layout(seed, limit=120.0):
+    """plays the first level built from seed
+
+    returns (seed, outcome, seconds, hops, distinct special pads, dead) where
+    outcome is 'complete', 'lost', 'timeout' or, for a dead layout that
+    can't be finished and so isn't played, 'dead'; seconds runs from the
+    level starting to it being decided.
+    """
+    sim = flysim.Simulation(seed=seed)
+    bot = Bot(sim)
+    sim.listener = bot.on_event
+    sim.ladder_begin()
+    while sim.win_status == 'intermission':
+        sim.step()
+
+    reachable = bot.reachable()
+    dead = any(p not in reachable for p in sim.specialPads)
+    distinct = len(set(sim.specialPads))
+
+    if dead:
+        return seed, 'dead', 0.0, 0, distinct, dead
+
+    start = sim.time
+    while sim.win_status == 'undecided' and sim.time - start < limit:
+        bot.control()
+        sim.step()
+    outcome = sim.win_status if sim.win_status != 'undecided' else 'timeout'
+    return seed, outcome, sim.time - start, bot.hops, distinct, dead
+
+
+def set_rules(overrides):
+    flysim.rules.update(overrides)
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))]
+
+
+def analyze(seeds, processes=None, overrides=None, limit=120.0):
+    """plays every seed in a process pool; returns the result rows in seed order"""
+    overrides = overrides or {}
+    if processes == 1:
+        set_rules(overrides)
+        rows = [play_layout(seed, limit) for seed in seeds]
+    else:
+        processes = processes or multiprocessing.cpu_count()
+        jobs = [(seed, limit) for seed in seeds]
+        # a few chunks per worker keeps them all busy to the end
+        chunksize = max(1, min(256, len(jobs) // (4 * processes)))
+        pool = multiprocessing.Pool(processes, initializer=set_rules, initargs=(overrides,))
+        try:
+            rows = pool.starmap(play_layout, jobs, chunksize)
+        finally:
+            pool.close()
+            pool.join()
+    return rows
+
+
+def report(rows, elapsed):
+    n = len(rows)
+    outcomes = collections.Counter(row[1] for row in rows)
+    finished = sorted(row[2] for row in rows if row[1] == 'complete')
+    repeats = sum(1 for row in rows if row[4] < flysim.rules['numSpecialPads'])
+
+    print("%d layouts in %.2f s (%.0f / minute)" % (n, elapsed, 60.0 * n / max(elapsed, 1e-9)))
+    print("complete %.1f%%, lost %.1f%%, timeout %.1f%%, dead %.1f%%" % tuple(
+        100.0 * outcomes[k] / n for k in ('complete', 'lost', 'timeout', 'dead')))
+    if finished:
+        print("time to finish: mean %.2f s, p50 %.2f, p95 %.2f, max %.2f" % (
+            sum(finished) / len(finished), percentile(finished, 50), percentile(finished, 95), finished[-1]))
+    print("layouts with a special pad picked twice %.1f%%" % (100.0 * repeats / n))
+    for outcome in ('dead', 'lost', 'timeout'):
+        bad = [str(row[0]) for row in rows if row[1] == outcome]
+        if bad:
+            print("%s seeds: %s%s" % (outcome, ' '.join(bad[:50]), ' ...' if len(bad) > 50 else ''))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plays many generated levels with a bot and reports on them.")
+    parser.add_argument('--seeds', type=int, default=1000, help="number of seeds to play")
+    parser.add_argument('--first', type=int, default=0, help="first seed")
+    parser.add_argument('--processes', type=int, default=None, help="worker processes, one per core by default")
+    parser.add_argument('--limit', type=float, default=120.0, help="seconds of play before a level times out")
+    parser.add_argument('--csv', help="write one row per seed to this file")
+    parser.add_argument('--rings', type=int)
+    parser.add_argument('--ring-spacing', dest='ringSpacing', type=float)
+    parser.add_argument('--specials', dest='numSpecialPads', type=int)
+    parser.add_argument('--inner-rings', dest='innerRings', type=int)
+    args = parser.parse_args(argv)
+
+    overrides = dict((k, getattr(args, k)) for k in TUNABLE if getattr(args, k) is not None)
+    rings = overrides.get('rings', flysim.rules['rings'])
+    innerRings = overrides.get('innerRings', flysim.rules['innerRings'])
+    if rings <= innerRings:
+        # special pads are only picked outside the inner rings
+        parser.error("--rings (%d) must be more than --inner-rings (%d)" % (rings, innerRings))
+    set_rules(overrides)
+    seeds = range(args.first, args.first + args.seeds)
+
+    start = time.perf_counter()
+    rows = analyze(seeds, args.processes, overrides, args.limit)
+    elapsed = time.perf_counter() - start
+
+    if args.csv:
+        with open(args.csv, 'w') as f:
+            f.write('seed,outcome,seconds,hops,distinct_specials,dead\n')
+            for row in rows:
+                f.write('%d,%s,%.3f,%d,%d,%d\n' % row)
+    report(rows, elapsed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+from __future__ import division, print_function, unicode_literals
+
+"""Packs the game's images into one texture atlas
+
+    python atlas.py
+
+reads IMAGES and writes atlas.png plus atlas.json, which maps each source
+name to its (x, y, width, height) region. y is measured from the bottom, as
+pyglet's get_region wants it. Only 8 bit RGBA, non-interlaced PNGs are
+handled, which is what the game ships; no imaging library is needed.
+"""
+
+import json
+import struct
+import zlib
+
+IMAGES = ['fly.png', 'circle6.png']
+ATLAS_IMAGE = 'atlas.png'
+ATLAS_INDEX = 'atlas.json'
+GUTTER = 2  # transparent pixels between regions so filtering can't bleed
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def read_png(path):
+    """returns width, height and rows of RGBA bytes, top row first"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError("%s is not a PNG" % path)
+
+    pos = 8
+    idat = []
+    while pos < len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if kind == b'IHDR':
+            width, height, depth, color, _, _, interlace = struct.unpack('>IIBBBBB', body)
+            if depth != 8 or color != 6 or interlace != 0:
+                raise ValueError("%s: only 8 bit RGBA non-interlaced PNGs are handled" % path)
+        elif kind == b'IDAT':
+            idat.append(body)
+        elif kind == b'IEND':
+            break
+
+    raw = zlib.decompress(b''.join(idat))
+    bpp = 4
+    stride = width * bpp
+    rows = []
+    prev = bytearray(stride)
+    pos = 0
+    for _ in range(height):
+        ftype = raw[pos]
+        line = bytearray(raw[pos + 1:pos + 1 + stride])
+        pos += 1 + stride
+        if ftype == 1:
+            for i in range(bpp, stride):
+                line[i] = (line[i] + line[i - bpp]) & 0xff
+        elif ftype == 2:
+            for i in range(stride):
+                line[i] = (line[i] + prev[i]) & 0xff
+        elif ftype == 3:
+            for i in range(stride):
+                left = line[i - bpp] if i >= bpp else 0
+                line[i] = (line[i] + ((left + prev[i]) >> 1)) & 0xff
+        elif ftype == 4:
+            for i in range(stride):
+                a = line[i - bpp] if i >= bpp else 0
+                b = prev[i]
+                c = prev[i - bpp] if i >= bpp else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                if pa <= pb and pa <= pc:
+                    pred = a
+                elif pb <= pc:
+                    pred = b
+                else:
+                    pred = c
+                line[i] = (line[i] + pred) & 0xff
+        rows.append(line)
+        prev = line
+    return width, height, rows
+
+
+def write_png(path, width, height, rows):
+    def chunk(kind, body):
+        return (struct.pack('>I', len(body)) + kind + body +
+                struct.pack('>I', zlib.crc32(kind + body) & 0xffffffff))
+
+    raw = b''.join(b'\x00' + bytes(row) for row in rows)
+    with open(path, 'wb') as f:
+        f.write(PNG_SIGNATURE)
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw, 9)))
+        f.write(chunk(b'IEND', b''))
+
+
+def pack(images):
+    """shelf packs {name: (w, h, rows)}; returns size and top-left positions"""
+    order = sorted(images, key=lambda name: -images[name][1])
+    width = sum(images[name][0] for name in order) + GUTTER * (len(order) - 1)
+    height = max(images[name][1] for name in order)
+    positions = {}
+    x = 0
+    for name in order:
+        positions[name] = (x, 0)
+        x += images[name][0] + GUTTER
+    return width, height, positions
+
+
+def build(names=IMAGES, image_path=ATLAS_IMAGE, index_path=ATLAS_INDEX):
+    images = {}
+    for name in names:
+        w, h, rows = read_png(name)
+        images[name] = (w, h, rows)
+
+    width, height, positions = pack(images)
+    canvas = [bytearray(width * 4) for _ in range(height)]
+    regions = {}
+    for name, (x, y) in positions.items():
+        w, h, rows = images[name]
+        for j, row in enumerate(rows):
+            canvas[y + j][x * 4:(x + w) * 4] = row
+        regions[name] = [x, height - y - h, w, h]
+
+    write_png(image_path, width, height, canvas)
+    with open(index_path, 'w') as f:
+        json.dump({"image": image_path, "regions": regions}, f, sort_keys=True)
+    return regions
+
+
+if __name__ == '__main__':
+    for name, region in sorted(build().items()):
+        print(name, region)
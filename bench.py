@@ -0,0 +1,390 @@
+from __future__ import division, print_function, unicode_literals
+
+"""Headless benchmarks of the simulation's hot paths
+
+    python bench.py [--rings 8,20,40] [--rounds N] [--filter TEXT]
+                    [--baseline FILE] [--save] [--threshold FRACTION]
+                    [--retries N]
+
+Microbenchmarks time single calls (nearestPad, a radar swipe, building a
+level, rotatePoint, a tick of the win flight, a full tick of play, taking
+and restoring a snapshot) and
+scenarios time scripted runs (hopping out across every ring, one whole
+revolution of the radar), each on levels of every ring count asked for.
+Nothing needs a window: the rules all live in flysim.
+
+A benchmark is set up afresh for every round, outside the timing, and its
+result is the best round, per call; short benchmarks get extra rounds.
+Every round also times a fixed reference loop right before and right after
+the benchmark, and the median over the rounds of the benchmark's ratio to
+it is what gets compared, so a machine that is busy for a while, or runs
+faster at one moment than the next, doesn't read as a regression.
+
+--save stores the results as the baseline; otherwise they are compared
+with it when there is one. A benchmark slower than the baseline by more
+than the threshold (a fraction, 0.25 by default) is measured again, up to
+--retries times, and if it stays slow the run exits with status 1.
+Baselines only compare on the machine they were saved on.
+
+Some benchmarks run markedly faster or slower depending on the string
+hash seed, a whole process at a time, which neither the reference nor a
+retry in the same process evens out; so the benchmarks always run with
+PYTHONHASHSEED=0, in a process of their own if need be.
+"""
+
+import os
+import gc
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import subprocess
+
+import flysim
+import snapshot
+
+BASELINE = 'bench_baseline.json'
+
+# (name, function(rings) -> (run, calls)), in the order they run
+benchmarks = []
+
+
+def benchmark(fn):
+    benchmarks.append((fn.__name__.replace('bench_', '', 1), fn))
+    return fn
+
+
+def playing(rings, seed=0, reuse_level=True):
+    """a simulation with rings rings, past the greeting and ready to play"""
+    sim = flysim.Simulation(seed=seed, rings=rings, reuse_level=reuse_level)
+    sim.ladder_begin()
+    while sim.win_status != 'undecided':
+        sim.step()
+    return sim
+
+
+def face(sim, x, y):
+    """turns the player towards world x, y"""
+    player = sim.player
+    player.rotation = math.degrees(math.atan2(x - player.x, y - player.y))
+    a = math.radians(player.rotation)
+    sim.impulse_x = math.sin(a)
+    sim.impulse_y = math.cos(a)
+
+
+# microbenchmarks
+
+@benchmark
+def bench_nearestPad(rings):
+    sim = playing(rings)
+    rng = random.Random(1)
+    reach = flysim.rules['hopReach']
+    queries = []
+    for _ in range(500):
+        pad = rng.choice(sim.pads)
+        a = rng.uniform(0.0, 2.0 * math.pi)
+        queries.append((pad.x, pad.y, pad.x + reach * math.sin(a), pad.y + reach * math.cos(a), pad))
+    nearestPad = sim.nearestPad
+
+    def run():
+        for fx, fy, tx, ty, pad in queries:
+            nearestPad(fx, fy, tx, ty, reach, pad)
+    return run, len(queries)
+
+
+@benchmark
+def bench_updateRadarSwipe(rings):
+    sim = playing(rings)
+    dt = flysim.rules['swipeInterval']  # every call swipes
+    calls = int(360.0 / flysim.rules['swipeStep'])
+
+    def run():
+        for _ in range(calls):
+            sim.time += dt
+            sim.run_timers()
+            sim.updateRadarSwipe(dt)
+    return run, calls
+
+
+@benchmark
+def bench_generate_level(rings):
+    # every level from scratch: add_pads, the grid and the sweep
+    sims = [flysim.Simulation(seed=i, rings=rings, reuse_level=False) for i in range(5)]
+
+    def run():
+        for sim in sims:
+            sim.generate_level()
+    return run, len(sims)
+
+
+@benchmark
+def bench_generate_level_reused(rings):
+    # the pads of the level being left are reset in place
+    sims = [playing(rings, seed=i) for i in range(5)]
+    for sim in sims:
+        sim.level_complete()
+
+    def run():
+        for sim in sims:
+            sim.generate_level()
+    return run, len(sims)
+
+
+@benchmark
+def bench_rotatePoint(rings):
+    sim = playing(rings)
+    points = [((pad.x, pad.y), 7.5 * pad.index) for pad in sim.pads[:500]]
+    origin = sim.origin
+    rotatePoint = sim.rotatePoint
+
+    def run():
+        for point, angle in points:
+            rotatePoint(point, origin, angle)
+    return run, len(points)
+
+
+@benchmark
+def bench_updatePlayerFlyingWin(rings):
+    sim = playing(rings)
+    sim.win_status = 'complete'
+    sim.set_button('up', 1)
+    sim.set_button('right', 1)
+    dt = sim.tick
+    calls = 2000
+
+    def run():
+        for _ in range(calls):
+            sim.updatePlayerFlyingWin(dt)
+    return run, calls
+
+
+@benchmark
+def bench_tick(rings):
+    # a full step of play with random input, levels ending and all
+    sim = playing(rings)
+    dt = sim.tick
+    calls = 2000
+
+    def run():
+        for _ in range(calls):
+            flysim.random_player(sim, dt)
+            sim.step(dt)
+    return run, calls
+
+
+@benchmark
+def bench_snapshot_take(rings):
+    sims = [playing(rings, seed=i) for i in range(5)]
+    for sim in sims:
+        for _ in range(600):
+            flysim.random_player(sim, sim.tick)
+            sim.step()
+
+    def run():
+        for sim in sims:
+            snapshot.take(sim)
+    return run, len(sims)
+
+
+@benchmark
+def bench_snapshot_restore(rings):
+    # back into the same simulation a while later, as a retry does
+    sims = [playing(rings, seed=i) for i in range(5)]
+    snaps = []
+    for sim in sims:
+        for _ in range(600):
+            flysim.random_player(sim, sim.tick)
+            sim.step()
+        snaps.append(snapshot.take(sim))
+        for _ in range(120):
+            flysim.random_player(sim, sim.tick)
+            sim.step()
+
+    def run():
+        for sim, data in zip(sims, snaps):
+            snapshot.restore(sim, data)
+    return run, len(sims)
+
+
+# scenarios
+
+@benchmark
+def bench_hop_all_rings(rings):
+    """hops from the start out to the last ring, a pad of each ring in turn"""
+    sims = [playing(rings, seed=i) for i in range(5)]
+
+    def hop_out(sim):
+        for ring in flysim.by_ring(sim.pads):
+            player = sim.player
+            if player.disabled:
+                break
+            pad = min(ring, key=lambda p: flysim.flymath.dist2(p.x, p.y, player.x, player.y))
+            face(sim, pad.x, pad.y)
+            sim.set_button('up', 1)
+            sim.step()
+            sim.set_button('up', 0)
+            while sim.player.hopping:
+                sim.step()
+
+    def run():
+        for sim in sims:
+            hop_out(sim)
+    return run, len(sims)
+
+
+@benchmark
+def bench_radar_revolution(rings):
+    """steps through one whole turn of the radar with the player still"""
+    sim = playing(rings)
+    steps = int(round(360.0 / flysim.rules['swipeStep'] * flysim.rules['swipeInterval'] / sim.tick))
+
+    def run():
+        for _ in range(steps):
+            sim.step()
+    return run, 1
+
+
+def reference():
+    """a fixed bit of plain Python, attribute access, float arithmetic and
+    calls, like the simulation's own; results are kept relative to it so
+    a machine running slower for a while doesn't read as a regression"""
+    class P(object):
+        __slots__ = ('x', 'y')
+
+    def touch(p, dx):
+        p.x += dx
+        p.y -= dx * 0.5
+        return p.x * p.x + p.y * p.y
+
+    p = P()
+    p.x = p.y = 0.0
+    total = 0.0
+    for i in range(20000):
+        total += touch(p, 0.001 * (i & 7))
+    return total
+
+
+def measure(fn, rings, rounds, least=0.2):
+    """seconds per call and the same in reference runs, over at least
+    rounds rounds, each set up afresh, adding rounds (up to ten times as
+    many) until least seconds have been timed
+
+    Every round times the reference, the benchmark and the reference again,
+    back to back, and takes the benchmark over the mean of the two; the
+    median of those paired ratios is what gets compared, and the fastest
+    round gives the seconds. As with timeit the collector is off while
+    timing."""
+    clock = time.perf_counter
+    best = None
+    ratios = []
+    timed = 0.0
+    while len(ratios) < rounds or (timed < least and len(ratios) < 10 * rounds):
+        run, calls = fn(rings)
+        gc.collect()
+        gc.disable()
+        try:
+            start = clock()
+            reference()
+            before = clock()
+            run()
+            after = clock()
+            reference()
+            end = clock()
+        finally:
+            gc.enable()
+        elapsed = after - before
+        timed += elapsed
+        per_call = elapsed / calls
+        ratios.append(per_call / (0.5 * (before - start + end - after)))
+        if best is None or per_call < best:
+            best = per_call
+    ratios.sort()
+    middle = len(ratios) // 2
+    if len(ratios) % 2:
+        relative = ratios[middle]
+    else:
+        relative = 0.5 * (ratios[middle - 1] + ratios[middle])
+    return best, relative
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except IOError:
+        return None
+
+
+def pinned_hash_seed(argv):
+    """runs bench.py again with PYTHONHASHSEED=0 and returns its exit
+    status, or None when this process already has that seed"""
+    if os.environ.get('PYTHONHASHSEED') == '0':
+        return None
+    env = dict(os.environ, PYTHONHASHSEED='0')
+    return subprocess.call([sys.executable, os.path.abspath(__file__)] + list(argv), env=env)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    status = pinned_hash_seed(argv)
+    if status is not None:
+        return status
+    parser = argparse.ArgumentParser(description="Times the simulation's hot paths headless.")
+    parser.add_argument('--rings', default='8,20,40',
+                        help="comma separated ring counts to run every benchmark at")
+    parser.add_argument('--rounds', type=int, default=7)
+    parser.add_argument('--filter', default='', help="only benchmarks whose name contains this")
+    parser.add_argument('--baseline', default=BASELINE, help="baseline file, JSON")
+    parser.add_argument('--save', action='store_true', help="store the results as the baseline")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="slowdown over the baseline, as a fraction, that fails the run")
+    parser.add_argument('--retries', type=int, default=2,
+                        help="times a benchmark over the threshold is measured again")
+    args = parser.parse_args(argv)
+    rings = [int(r) for r in args.rings.split(',')]
+
+    baseline = None if args.save else load_baseline(args.baseline)
+    results = {}  # name -> [seconds per call, the same in reference runs]
+    regressions = []
+    for name, fn in benchmarks:
+        if args.filter not in name:
+            continue
+        for r in rings:
+            key = '%s[rings=%d]' % (name, r)
+            seconds, relative = measure(fn, r, args.rounds)
+            line = "%-40s %12.2f us" % (key, 1e6 * seconds)
+            if baseline and key in baseline:
+                change = relative / baseline[key][1] - 1.0
+                # a slow result gets measured again before it's believed
+                for _ in range(args.retries):
+                    if change <= args.threshold:
+                        break
+                    again = measure(fn, r, args.rounds)
+                    if again[1] < relative:
+                        seconds, relative = again
+                        change = relative / baseline[key][1] - 1.0
+                line += "  %+6.1f%%" % (100.0 * change)
+                if change > args.threshold:
+                    line += "  REGRESSION"
+                    regressions.append(key)
+            results[key] = [seconds, relative]
+            print(line)
+            sys.stdout.flush()
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print("saved %d results to %s" % (len(results), args.baseline))
+    elif baseline is None:
+        print("no baseline in %s; --save stores one" % args.baseline)
+    if regressions:
+        print("%d regressed more than %.0f%%: %s" % (len(regressions), 100.0 * args.threshold, ', '.join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,9 @@
 from __future__ import division, print_function, unicode_literals
 
+import time
+# startup milestones, in time.perf_counter() seconds; see StartupReport
+startup = {'start': time.perf_counter()}
+
 # This code is so you can run the samples without installing the package
 import sys
 import os
@@ -7,18 +11,26 @@ import os
 #
 
 import random
-import math
+import argparse
+import json
+import ctypes
+import collections
+
+import flysim
+import snapshot
+import tween
+# replay and instrument are only imported when their options are used, and
+# swarm (with numpy) when the first swarm flies
 
 import pyglet
+from pyglet import gl
 from pyglet.window import key
-from pyglet.gl import *
 
 import cocos
 from cocos.director import director
-import cocos.collision_model as cm
-import cocos.euclid as eu
 import cocos.actions as ac
-from cocos import draw
+
+startup['imports'] = time.perf_counter()
     
 consts = {
     "window": {
@@ -28,14 +40,9 @@ consts = {
         "resizable": True
     },
     "world": {
+        # game rules live in flysim.rules
         "width": 400,
         "height": 300,
-        "rPlayer": 8.0,
-        "wall_scale_min": 0.75,  # relative to player
-        "wall_scale_max": 2.25,  # relative to player
-        "topSpeed": 100.0,
-        "angular_velocity": 300.0,  # degrees / s
-        "accel": 200.0,
         "bindings": {
             key.LEFT: 'left',
             key.RIGHT: 'right',
@@ -46,6 +53,21 @@ consts = {
         # as the font file is not provided it will decay to the default font;
         # the setting is retained anyway to not downgrade the code
         "font_name": 'Arial Black',
+        # label layouts handed out by LabelPool
+        "labels": {
+            'banner': {'font_size': 52, 'width': 800, 'multiline': True},
+            'pad': {'font_size': 20, 'width': 600, 'multiline': False},
+            'background': {'font_size': 50, 'width': 400, 'multiline': False},
+        },
+        # the flies let loose when a level is complete; the plain Python
+        # integrator, without numpy, gets fewer
+        "swarm": {
+            'flies': 1500,
+            'plainFlies': 200,
+            'speed': (40.0, 150.0),  # world units per second
+            'turn': 1.5,  # radians per second, either way
+            'radius': 4.0,  # world units, half the player's
+        },
         "palette": {
             'bg': (180, 180, 250),
             'player': (255, 255, 255),
@@ -61,39 +83,832 @@ consts = {
 scale_x = consts["window"]["width"] / consts["world"]["width"]
 scale_y = consts["window"]["height"] / consts["world"]["height"]
 
-# view to world scales
-inv_scale_x = consts["world"]["width"] / consts["window"]["width"]
-inv_scale_y = consts["world"]["height"] / consts["window"]["height"]
-
 
 def world_to_view(v):
-    """world coords to view coords; v an eu.Vector2, returns (float, float)"""
+    """world coords to view coords; v anything with x, y, returns (float, float)"""
     return v.x * scale_x, v.y * scale_y
-    
-def view_to_world(x, y):
-    """world coords to view coords; v an eu.Vector2, returns (float, float)"""
-    return x * inv_scale_x, y * inv_scale_y
+
+
+def acting(node):
+    """True while node or anything below it is on the clock stepping
+    actions; cocos keeps a node's step scheduled for a couple of frames after
+    it enters the stage even with none, and every scheduled step means
+    another frame drawn"""
+    if node is None:
+        return False
+    if node.scheduled:
+        return True
+    for child in node.get_children():
+        if acting(child):
+            return True
+    return False
 
 
 class Actor(cocos.sprite.Sprite):
     palette = {}  # injected later
 
-    def __init__(self, cx, cy, radius, btype, img, vel=None):
+    def __init__(self, cx, cy, radius, btype, img):
         super(Actor, self).__init__(img)
         # the 1.05 so that visual radius a bit greater than collision radius
-        self.scale = (radius * 1.05) * scale_x / (self.image.width / 2.0)
+        # (collisions and pad lookups are flysim's job)
+        self.base_scale = (radius * 1.05) * scale_x / (self.image.width / 2.0)
         self.btype = btype
-        self.color = self.palette[btype]
-        self.cshape = cm.CircleShape(eu.Vector2(cx, cy), radius)
-        self.update_center(self.cshape.center)
-        if vel is None:
-            vel = eu.Vector2(0.0, 0.0)
-        self.vel = vel
+        self.reset(cx, cy)
+
+    def on_enter(self):
+        super(Actor, self).on_enter()
+        # actors are moved by tweens, not actions; without this each one
+        # moved between batches would keep the clock ticking a frame or two
+        if not self.are_actions_running():
+            self.pause()
+
+    def reset(self, cx, cy):
+        """back to the look of a fresh actor at world coords cx, cy"""
+        self.stop()
+        self.scale = self.base_scale
+        self.color = self.palette[self.btype]
+        self.opacity = 255
+        self.rotation = 0
+        self.position = cx * scale_x, cy * scale_y
+
+
+class DrawCallCounter(object):
+
+    """Counts the GL draw calls pyglet's vertex domains issue
+
+    Everything cocos draws (sprites, batches, labels, layers) ends up in one of
+    these, so under a software renderer (LIBGL_ALWAYS_SOFTWARE=1 for Mesa
+    llvmpipe) the per frame count is what to watch.
+    """
+
+    gl_names = ('glDrawArrays', 'glDrawElements', 'glMultiDrawArrays', 'glMultiDrawElements')
+
+    def __init__(self):
+        self.calls = 0
+        self.frames = 0
+
+    def install(self, interval=1.0):
+        from pyglet.graphics import vertexdomain
+        for name in self.gl_names:
+            fn = getattr(vertexdomain, name, None)
+            if fn is not None:
+                setattr(vertexdomain, name, self.counted(fn))
+        pyglet.clock.schedule(self.count_frame)
+        pyglet.clock.schedule_interval(self.report, interval)
+
+    def counted(self, fn):
+        def draw_call(*args):
+            self.calls += 1
+            return fn(*args)
+        return draw_call
+
+    def count_frame(self, dt):
+        self.frames += 1
+
+    def report(self, dt):
+        if self.frames:
+            print("draw calls per frame: %.1f (%d frames)" % (self.calls / self.frames, self.frames))
+        self.calls = 0
+        self.frames = 0
+
+
+class LabelPool(object):
+
+    """Laid out labels, kept per (style, text) and handed out again
+
+    A label costs glyph layout and vertex lists when it is created, so each
+    one is built once and goes back to the pool when its effect is over.
+    Transient labels are handed to play, which returns them by itself; the
+    rest are released by whoever added them. live counts labels out.
+    """
+
+    def __init__(self, styles):
+        self.styles = styles
+        self.free = {}
+        self.live = 0
+
+    def create(self, style, text):
+        label = cocos.text.Label(text,
+                                 font_name=consts['view']['font_name'],
+                                 anchor_y='center',
+                                 anchor_x='center',
+                                 align="center",
+                                 **self.styles[style])
+        label.btype = "label"
+        label.pool_key = (style, text)
+        label.pooled = True
+        return label
+
+    def prepare(self, style, texts):
+        """lays out a spare label for each text ahead of use"""
+        for text in texts:
+            free = self.free.setdefault((style, text), [])
+            if not free:
+                free.append(self.create(style, text))
+
+    def acquire(self, style, text):
+        free = self.free.get((style, text))
+        if free:
+            label = free.pop()
+        else:
+            label = self.create(style, text)
+        label.pooled = False
+        self.live += 1
+        label.opacity = 255
+        label.scale = 1.0
+        label.visible = True
+        return label
+
+    def release(self, label):
+        label.stop()
+        if label.parent is not None:
+            label.kill()
+        # twice in the pool would hand one label out twice
+        if label.pooled:
+            return
+        label.pooled = True
+        self.live -= 1
+        self.free.setdefault(label.pool_key, []).append(label)
+
+    def play(self, label, action):
+        """runs action on label, then takes it off screen and back"""
+        label.do(action + ac.CallFuncS(self.release))
+
+    def count(self):
+        return sum(len(free) for free in self.free.values())
+
+
+def load_pics():
+    """player and pad images, out of the prebuilt atlas when there is one
+
+    atlas.json and atlas.png come from atlas.py; one file to decode and one
+    texture for pads and player alike.
+    """
+    try:
+        with pyglet.resource.file('atlas.json', 'r') as f:
+            index = json.load(f)
+    except pyglet.resource.ResourceNotFoundException:
+        get = pyglet.resource.image
+    else:
+        atlas = pyglet.resource.image(index['image'])
+        regions = index['regions']
+
+        def get(name):
+            return atlas.get_region(*regions[name])
+
+    pics = {}
+    pics["player"] = get('fly.png')
+    pics["pad"] = get('circle6.png')
+    pics["wall"] = pics["pad"]
+    return pics
+
+
+class StartupReport(object):
+
+    """Reports how long startup took, optionally against a budget
+
+    Milestones are the imports, window creation and the first frame on
+    screen, all measured from the top of this module.
+    """
+
+    def __init__(self, budget=None, quit=False):
+        self.budget = budget
+        self.quit = quit
+        self.over_budget = False
+        self.reports = 0
+
+    def install(self, window):
+        window.push_handlers(on_draw=self.on_draw)
+
+    def on_draw(self):
+        # handlers are held as weak methods, which only remove_handlers
+        # matches a bound method against
+        director.window.remove_handlers(on_draw=self.on_draw)
+        # the next tick comes after this frame has been flipped
+        pyglet.clock.schedule_once(self.first_frame, 0)
+
+    def first_frame(self, dt):
+        self.reports += 1
+        startup['first_frame'] = time.perf_counter()
+        start = startup['start']
+        total = startup['first_frame'] - start
+        print("startup: imports %.0f ms, window %.0f ms, first frame %.0f ms, total %.0f ms" % (
+            1000.0 * (startup['imports'] - start),
+            1000.0 * (startup['window'] - startup['imports']),
+            1000.0 * (startup['first_frame'] - startup['window']),
+            1000.0 * total))
+        if self.budget is not None:
+            self.over_budget = total > self.budget
+            print("startup budget %.0f ms: %s" % (1000.0 * self.budget, "OVER" if self.over_budget else "ok"))
+        if self.quit:
+            pyglet.app.exit()
+
+
+class HopLatency(object):
+
+    """Time from pressing up to the fly visibly moving
+
+    A press is timed from the key event to the end of the first update after
+    it that puts the player sprite somewhere else, which is the frame drawn
+    next: waiting for a tick, the hop itself and the interpolation all count.
+    Presses that start no hop within patience (mid-hop, between levels) are
+    dropped.
+    """
+
+    patience = 0.25
+
+    def __init__(self):
+        import instrument
+        self.histogram = instrument.Histogram()
+        self.clock = time.perf_counter
+        self.pressed = None  # clock at the press being timed
+        self.origin = None  # player sprite position at the press
+        self.hopped = False
+
+    def press(self, position):
+        self.pressed = self.clock()
+        self.origin = position
+        self.hopped = False
+
+    def hop(self):
+        if self.pressed is not None:
+            self.hopped = True
+
+    def frame(self, position):
+        if self.pressed is None:
+            return
+        elapsed = self.clock() - self.pressed
+        if self.hopped:
+            if position != self.origin:
+                self.histogram.add(elapsed)
+                self.pressed = None
+        elif elapsed > self.patience:
+            self.pressed = None
+
+
+class IdlePacer(object):
+
+    """
+    Responsibilities:
+        Frames: the view updates, and so draws, every frame while anything
+                on screen changes and someone has pressed a key lately
+        Idle: once nothing has changed for settle seconds it only updates
+              when the simulation has something due or a tween starts, at
+              most longest seconds apart, and nothing is drawn between;
+              left unattended for that long, with only pads and labels
+              animating and the fly still, it updates ambient times a
+              second
+        Wake: a key press, or the fly moving, brings every frame back at
+              once, with the time napped caught up first
+        Time: hands the view the clock time since its last update, so no
+              time is lost or counted twice across a nap
+    """
+
+    settle = 0.5
+    longest = 0.2  # under the view's max_catch_up, so no sim time is dropped
+    unattended = 15.0
+    ambient = 20.0
+
+    def __init__(self, view):
+        self.view = view
+        self.clock = pyglet.clock.get_default()
+        self.last = None
+        self.pressed = None  # clock at the latest key press
+        self.idle = False
+        self.stillFor = 0.0
+        self.naps = 0  # updates run while idle
+
+    def start(self):
+        self.last = self.pressed = self.clock.time()
+        self.view.schedule(self.frame)
+        pyglet.clock.schedule_once(self.take_closing, 0)
+
+    def take_closing(self, dt):
+        # director.run polls for a quit ten times a second, and pyglet draws
+        # a frame after every poll; updates, never further apart than
+        # longest, poll instead
+        pyglet.clock.unschedule(director.handle_closing)
+
+    def elapsed(self):
+        now = self.clock.time()
+        dt = now - self.last
+        self.last = now
+        return dt
+
+    def wait(self, dt):
+        """seconds to the next update after one dt long, or None for the
+        next frame"""
+        view = self.view
+        if view.still():
+            self.stillFor += dt
+            if self.stillFor >= self.settle:
+                return view.idle_wait(self.longest)
+            return None
+        self.stillFor = 0.0
+        if self.last - self.pressed >= self.unattended and not view.engaged():
+            return 1.0 / self.ambient
+        return None
+
+    def frame(self, dt):
+        dt = self.elapsed()
+        self.view.update(dt)
+        director.handle_closing(dt)
+        wait = self.wait(dt)
+        if wait is not None:
+            self.idle = True
+            self.view.unschedule(self.frame)
+            pyglet.clock.schedule_once(self.nap, wait)
+
+    def nap(self, dt):
+        dt = self.elapsed()
+        self.view.update(dt)
+        director.handle_closing(dt)
+        self.naps += 1
+        wait = self.wait(dt)
+        if wait is not None:
+            pyglet.clock.schedule_once(self.nap, wait)
+        else:
+            self.resume()
+
+    def wake(self):
+        """every frame from now on; for key presses"""
+        if self.idle:
+            pyglet.clock.unschedule(self.nap)
+            self.view.update(self.elapsed())
+            self.resume()
+        self.pressed = self.clock.time()
+        self.stillFor = 0.0
+
+    def resume(self):
+        self.idle = False
+        self.stillFor = 0.0
+        self.view.schedule(self.frame)
+
+
+class StatsLayer(cocos.layer.Layer):
+
+    """Frame timing overlay
+
+    Responsability:
+    switching the profiler on and off with F3, closing its frames, and
+    showing frame time percentiles, per phase times and node counts.
+    Nothing is built until it is first needed.
+    """
+    is_event_handler = True
+    toggle_key = key.F3
+
+    def __init__(self, playview, scene):
+        super(StatsLayer, self).__init__()
+        self.playview = playview
+        self.scene = scene
+        self.profiler = None
+        self.label = None
+        self.visible = False
+
+    def setup(self):
+        if self.profiler is not None:
+            return
+        import instrument
+        self.profiler = profiler = instrument.Profiler()
+        view = self.playview
+        sim = view.sim
+        profiler.watch(sim, 'run_timers', 'timers')
+        profiler.watch(sim, 'updateRadarSwipe', 'radar')
+        profiler.watch(sim, 'updateSpecialPads', 'special')
+        profiler.watch(sim, 'hop', 'hop')
+        profiler.watch(sim, 'updateHop', 'motion')
+        profiler.watch(sim, 'updatePlayerFlyingWin', 'motion')
+        profiler.watch(view.tweens, 'step', 'tweens')
+        profiler.watch(view, 'step_swarm', 'swarm')
+        profiler.watch(view, 'sync_player', 'sync')
+        profiler.watch(self.scene, 'visit', 'draw')
+
+        w, h = director.get_window_size()
+        self.label = cocos.text.Label('',
+                                      font_size=10,
+                                      anchor_x='left',
+                                      anchor_y='top',
+                                      width=w,
+                                      multiline=True,
+                                      color=(0, 0, 0, 255))
+        self.label.position = (5, h - 5)
+        self.add(self.label)
+
+    def on_key_press(self, k, m):
+        if k == self.toggle_key:
+            self.show(not self.visible)
+            return True
+        return False
+
+    def show(self, visible):
+        self.setup()
+        self.visible = visible
+        pyglet.clock.unschedule(self.refresh)
+        if visible:
+            pyglet.clock.schedule_interval(self.refresh, 0.5)
+        self.update_profiler()
+
+    def start_trace(self):
+        self.setup()
+        self.profiler.start_trace()
+        self.update_profiler()
+
+    def update_profiler(self):
+        # a trace keeps the profiler going without the overlay
+        pyglet.clock.unschedule(self.profiler.frame)
+        if self.visible or self.profiler.trace is not None:
+            self.profiler.enable()
+            pyglet.clock.schedule(self.profiler.frame)
+        else:
+            self.profiler.disable()
+
+    def counts(self):
+        actions = 0
+        labels = 0
+        nodes = [director.scene]
+        while nodes:
+            node = nodes.pop()
+            actions += len(node.actions)
+            if getattr(node, 'btype', None) == "label":
+                labels += 1
+            nodes.extend(node.get_children())
+        view = self.playview
+        actors = len(view.padSprites) - view.padSprites.count(None) + (view.player is not None)
+        return actors, actions, len(view.tweens), labels
+
+    def refresh(self, dt):
+        profiler = self.profiler
+        lines = []
+        stats = profiler.stats()
+        if stats:
+            lines.append("frame ms  p50 %(p50).2f  p95 %(p95).2f  p99 %(p99).2f  max %(max).2f" % stats)
+        for phase in profiler.phases:
+            lines.append("%-8s %.3f ms" % (phase, 1000.0 * profiler.last[phase]))
+        lines.append("actors %d  actions %d  tweens %d  labels %d" % self.counts())
+        latency = self.playview.latency
+        if latency is not None and latency.histogram.samples:
+            stats = latency.histogram.stats()
+            lines.append("hop latency ms  p50 %(p50).1f  p95 %(p95).1f  max %(max).1f  (%(count)d)" % stats)
+        self.label.element.text = '\n'.join(lines)
+
+
+class PadFieldCache(cocos.batch.BatchNode):
+
+    """A batch of sprites drawn from a texture while none of them change
+
+    Responsibilities:
+        Cache: renders the batch into an offscreen texture, through a
+        framebuffer object, when it has been invalidated, and otherwise
+        draws just that texture: one quad of fill and a draw call however
+        many sprites are in it
+        Fallback: draws the batch as any BatchNode would when there are no
+        framebuffer objects, or the field would need a texture bigger than
+        max_size
+    """
+
+    max_size = 2048
+    margin = 16  # view pixels around the field, for sprites over its edge
+
+    def __init__(self):
+        super(PadFieldCache, self).__init__()
+        self.texture = None
+        self.region = None  # of the texture the field takes up
+        self.fbo = None
+        self.dirty = True
+        self.renders = 0
+
+    @property
+    def caching(self):
+        return self.texture is not None
+
+    def resize(self, width, height):
+        """sets the field to width x height view pixels, caching it if it can"""
+        m = self.margin
+        w, h = int(width) + 1 + 2 * m, int(height) + 1 + 2 * m
+        self.dirty = True
+        if self.region is not None and (self.region.width, self.region.height) == (w, h):
+            return
+        self.texture = self.region = self.fbo = None
+        if w > self.max_size or h > self.max_size:
+            return
+        size = 64
+        while size < max(w, h):
+            size *= 2
+        try:
+            from cocos.gl_framebuffer_object import FramebufferObject
+            texture = pyglet.image.Texture.create(size, size)
+            fbo = FramebufferObject()
+            fbo.bind()
+            fbo.texture2d(texture)
+            fbo.check_status()
+            fbo.unbind()
+        except Exception:  # no framebuffer objects here; the field is drawn live
+            return
+        self.texture, self.fbo = texture, fbo
+        self.region = texture.get_region(0, 0, w, h)
+
+    def invalidate(self):
+        self.dirty = True
+
+    def visit(self):
+        if not self.visible:
+            return
+        gl.glPushMatrix()
+        self.transform()
+        if self.texture is None:
+            self.batch.draw()
+        else:
+            if self.dirty:
+                self.render()
+            gl.glEnable(gl.GL_BLEND)
+            gl.glBlendFunc(gl.GL_ONE, gl.GL_ONE_MINUS_SRC_ALPHA)
+            gl.glColor4ub(255, 255, 255, 255)
+            self.region.blit(-self.margin, -self.margin)
+            gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+        gl.glPopMatrix()
+
+    def render(self):
+        texture = self.texture
+        m = self.margin
+        viewport = (gl.GLint * 4)()
+        gl.glGetIntegerv(gl.GL_VIEWPORT, viewport)
+        clear = (gl.GLfloat * 4)()
+        gl.glGetFloatv(gl.GL_COLOR_CLEAR_VALUE, clear)
+
+        self.fbo.bind()
+        gl.glViewport(0, 0, texture.width, texture.height)
+        gl.glMatrixMode(gl.GL_PROJECTION)
+        gl.glPushMatrix()
+        gl.glLoadIdentity()
+        gl.glOrtho(-m, texture.width - m, -m, texture.height - m, -1, 1)
+        gl.glMatrixMode(gl.GL_MODELVIEW)
+        gl.glPushMatrix()
+        gl.glLoadIdentity()
+        gl.glClearColor(0, 0, 0, 0)
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+
+        # blended as usual onto the clear texture the colour comes out
+        # premultiplied, which the blit relies on; alpha has to be the
+        # coverage itself, which a second, alpha only, pass with MAX gives
+        self.batch.draw()
+        gl.glColorMask(gl.GL_FALSE, gl.GL_FALSE, gl.GL_FALSE, gl.GL_TRUE)
+        gl.glBlendEquation(gl.GL_MAX)
+        self.batch.draw()
+        gl.glBlendEquation(gl.GL_FUNC_ADD)
+        gl.glColorMask(gl.GL_TRUE, gl.GL_TRUE, gl.GL_TRUE, gl.GL_TRUE)
+
+        gl.glPopMatrix()
+        gl.glMatrixMode(gl.GL_PROJECTION)
+        gl.glPopMatrix()
+        gl.glMatrixMode(gl.GL_MODELVIEW)
+        self.fbo.unbind()
+        gl.glViewport(*viewport)
+        gl.glClearColor(*clear)
+        self.dirty = False
+        self.renders += 1
+
+
+class SwarmNode(cocos.cocosnode.CocosNode):
+
+    """The celebration swarm
+
+    Responsibilities:
+        Flight: a swarm.Swarm stepped once a frame inside the world's walls
+        Display: one quad per fly in a single pyglet vertex list; the
+        corners of every fly go in with one copy, so a frame costs the
+        integrator and a draw call instead of a sprite update per fly.
+        The swarm module, numpy and the buffers wait for the first release,
+        off the way to the first frame.
+    """
+
+    def __init__(self, image, settings):
+        super(SwarmNode, self).__init__()
+        self.settings = settings
+        self.image = image
+        self.swarm = None
+        # sized like the player sprite, see Actor
+        self.half_w = settings['radius'] * 1.05 * scale_x
+        self.half_h = self.half_w * image.height / image.width
+        self.visible = False
+
+    def build(self):
+        import swarm
+        settings = self.settings
+        capacity = settings['flies'] if swarm.numpy is not None else settings['plainFlies']
+        self.capacity = capacity
+        self.swarm = swarm.Swarm(capacity)
+        texture = self.image.get_texture()
+        group = pyglet.sprite.SpriteGroup(texture, gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+        self.batch = pyglet.graphics.Batch()
+        self.vertex_list = self.batch.add(
+            4 * capacity, gl.GL_QUADS, group,
+            ('v2f/stream', [0.0] * (8 * capacity)),
+            ('t3f/static', tuple(texture.tex_coords) * capacity),
+            ('c4B/static', (255,) * (16 * capacity)))
+        # the swarm's vertex buffer seen as ctypes, for memmove
+        self.corners = (ctypes.c_float * (8 * capacity)).from_buffer(self.swarm.vertices)
+
+    def release(self, x, y, rng):
+        if self.swarm is None:
+            self.build()
+        settings = self.settings
+        self.swarm.release(self.capacity, x, y, settings['speed'], settings['turn'], rng)
+        self.visible = True
+
+    def clear(self):
+        self.visible = False
+        if self.swarm is None:
+            return
+        self.swarm.clear()
+        self.upload()
+
+    def step(self, dt, width, height):
+        flies = self.swarm
+        if flies is None or not flies.count:
+            return
+        r = self.half_w / scale_x
+        flies.step(dt, r, r, width - r, height - r)
+        flies.quads(self.half_w, self.half_h, scale_x, scale_y)
+        self.upload()
+
+    def upload(self):
+        ctypes.memmove(self.vertex_list.vertices, self.corners, ctypes.sizeof(self.corners))
+
+    def draw(self):
+        gl.glPushMatrix()
+        self.transform()
+        self.batch.draw()
+        gl.glPopMatrix()
+
+
+def speed_up_clock(factor):
+    """runs pyglet's clock, and so everything scheduled on it, factor times
+    faster than the wall clock; must come before director.init"""
+    real = time.perf_counter
+    start = real()
+    clock = pyglet.clock.Clock(time_function=lambda: start + (real() - start) * factor)
+    pyglet.clock.set_default(clock)
+    pyglet.app.event_loop.clock = clock
+
 
-    def update_center(self, cshape_center):
-        """cshape_center must be eu.Vector2"""
-        self.position = world_to_view(cshape_center)
-        self.cshape.center = cshape_center
+class Soak(object):
+
+    """Long-run leak check, --soak CYCLES
+
+    Responsibilities:
+        Play: an analyze.Bot plays every level through the playback hooks,
+        so keys are ignored, while the clock runs sped up
+        Measure: at the start of every ladder, traced memory (tracemalloc),
+        scene nodes, running actions and labels out of the pool
+        Verdict: past the warmup cycles, the last quarter of the samples
+        against the first; memory grown by more than slack, or any count
+        grown at all, fails the run
+    """
+
+    def __init__(self, view, labels, cycles, warmup=4, slack=256 * 1024):
+        import tracemalloc
+        import analyze
+        self.tracemalloc = tracemalloc
+        self.view = view
+        self.labels = labels
+        self.cycles = cycles
+        self.warmup = warmup
+        self.slack = slack
+        self.samples = []  # (bytes, nodes, actions, labels out) per ladder
+        self.baseline = None  # allocations at the end of the warmup
+        self.failed = False
+
+        sim = view.sim
+        self.bot = analyze.Bot(sim)
+        sim.listener = self.on_sim_event
+        view.playback = self
+        tracemalloc.start()
+
+    # the playback hooks Worldview.step_sim calls
+
+    def done(self, sim):
+        return False
+
+    def apply(self, sim):
+        if sim.win_status == 'undecided':
+            self.bot.control()
+
+    def on_sim_event(self, event, *args):
+        self.view.on_sim_event(event, *args)
+        self.bot.on_event(event, *args)
+        if event == 'level_cleared':
+            self.measure()
+
+    def measure(self):
+        actions = nodes = 0
+        todo = [director.scene]
+        while todo:
+            node = todo.pop()
+            nodes += 1
+            actions += len(node.actions)
+            todo.extend(node.get_children())
+        memory = self.tracemalloc.get_traced_memory()[0]
+        self.samples.append((memory, nodes, actions, self.labels.live))
+        print("soak %d/%d: %d KiB, nodes %d, actions %d, labels out %d, pooled %d" % (
+            len(self.samples), self.cycles, memory // 1024, nodes, actions, self.labels.live, self.labels.count()))
+        if len(self.samples) == self.warmup:
+            self.baseline = self.tracemalloc.take_snapshot()
+        if len(self.samples) == self.cycles:
+            self.finish()
+
+    def finish(self):
+        samples = self.samples[self.warmup:]
+        quarter = max(1, len(samples) // 4)
+        first, last = samples[:quarter], samples[-quarter:]
+        problems = []
+        grown = min(s[0] for s in last) - max(s[0] for s in first)
+        if grown > self.slack:
+            problems.append("memory grew %d KiB" % (grown // 1024))
+        for i, name in ((1, 'nodes'), (2, 'actions'), (3, 'labels out')):
+            low, high = max(s[i] for s in first), min(s[i] for s in last)
+            if high > low:
+                problems.append("%s grew from %d to %d" % (name, low, high))
+
+        self.failed = bool(problems)
+        if self.failed:
+            print("soak FAILED: " + "; ".join(problems))
+            if self.baseline is not None:
+                print("largest growth since warmup:")
+                for stat in self.tracemalloc.take_snapshot().compare_to(self.baseline, 'lineno')[:10]:
+                    print("  %s" % stat)
+        else:
+            print("soak ok: %d cycles" % len(self.samples))
+        self.tracemalloc.stop()
+        pyglet.app.exit()
+
+
+class IdleCheck(object):
+
+    """Frames drawn while nobody plays, --idle-check SECONDS
+
+    Responsibilities:
+        Count: past the warmup, every on_draw the window gets and every
+        update the view runs, frames and naps alike, for seconds with no
+        input
+        Verdict: each update may draw a frame and no more; draws beyond
+        that by more than slack a second are something else keeping pyglet
+        awake, and fail the run, as does a startup report printed twice
+    """
+
+    def __init__(self, view, seconds, report=None, warmup=3.0, slack=1.0):
+        self.view = view
+        self.seconds = seconds
+        self.report = report
+        self.slack = slack
+        self.counting = False
+        self.draws = 0
+        self.idleDraws = 0  # drawn while the pacer napped
+        self.updates = 0
+        self.naps = 0
+        self.failed = False
+        self.update = view.update
+        view.update = self.on_update
+        director.window.push_handlers(on_draw=self.on_draw)
+        pyglet.clock.schedule_once(self.begin, warmup)
+
+    def on_update(self, dt):
+        if self.counting:
+            self.updates += 1
+        self.update(dt)
+
+    def on_draw(self):
+        if self.counting:
+            self.draws += 1
+            if self.view.pacer.idle:
+                self.idleDraws += 1
+
+    def begin(self, dt):
+        if self.view.labelsToPrepare:
+            # labels still laid out a few a frame
+            pyglet.clock.schedule_once(self.begin, 0.5)
+            return
+        self.counting = True
+        self.naps = self.view.pacer.naps
+        pyglet.clock.schedule_once(self.finish, self.seconds)
+
+    def finish(self, dt):
+        self.counting = False
+        self.naps = self.view.pacer.naps - self.naps
+        print("idle check %.0f s: %d draws (%d while idle), %d updates (%d naps), %.1f draws a second" % (
+            self.seconds, self.draws, self.idleDraws, self.updates, self.naps, self.draws / self.seconds))
+        problems = []
+        extra = self.draws - self.updates
+        if extra > self.slack * self.seconds:
+            problems.append("%d draws without an update" % extra)
+        if self.report is not None and self.report.reports != 1:
+            problems.append("startup report printed %d times" % self.report.reports)
+        self.failed = bool(problems)
+        if self.failed:
+            print("idle check FAILED: " + "; ".join(problems))
+        else:
+            print("idle check ok")
+        director.window.remove_handlers(on_draw=self.on_draw)
+        pyglet.app.exit()
 
 
 class MessageLayer(cocos.layer.Layer):
@@ -105,20 +920,17 @@ class MessageLayer(cocos.layer.Layer):
     optional callback after hiding the message.
     """
 
+    def __init__(self, labels):
+        super(MessageLayer, self).__init__()
+        self.labels = labels
+
     def show_message(self, msg, callback=None):
         w, h = director.get_window_size()
 
-        self.msg = cocos.text.Label(msg,
-                                    font_size=52,
-                                    font_name=consts['view']['font_name'],
-                                    anchor_y='center',
-                                    anchor_x='center',
-                                    width=w,
-                                    multiline=True,
-                                    align="center")
-        self.msg.position = (w / 2.0, h)
+        label = self.labels.acquire('banner', msg)
+        label.position = (w / 2.0, h)
 
-        self.add(self.msg)
+        self.add(label)
 
         actions = (
             ac.Show() + ac.Accelerate(ac.MoveBy((0, -h / 2.0), duration=0.5)) +
@@ -130,31 +942,41 @@ class MessageLayer(cocos.layer.Layer):
         if callback:
             actions += ac.CallFunc(callback)
 
-        self.msg.do(actions)
+        self.labels.play(label, actions)
         
     def show_label(self, label):
         self.add(label)    
 
 
-def reflection_y(a):
-    assert isinstance(a, eu.Vector2)
-    return eu.Vector2(a.x, -a.y)
-
-
 class Worldview(cocos.layer.Layer):
 
     """
     Responsibilities:
-        Generation: random generates a level
-        Initial State: Set initial playststate
-        Play: updates level state, by time and user input. Detection of
-        end-of-level conditions.
-        Level progression.
+        Display: one sprite per pad of a flysim.Simulation plus the player,
+        all in a single batch, and the effects for the events the simulation
+        reports.
+        Effects: pad and player tweens run from one tween.Tweener.
+        Input: forwards bound keys to the simulation, optionally recording
+        them, or feeds it a replay.Replay instead.
+        Levels come from the simulation's RNG, or from a levelpack.LevelPack
+        starting at entry level_index.
+        Camera: follows the player when the world is bigger than the window;
+        only pads near it have sprites, the rest stay dormant as bare
+        flysim.Pads until the camera comes close.
+        Rewind: F5 keeps a snapshot of the simulation and F9 goes back to
+        it; backspace retries from a checkpoint a little before now. The
+        view is rebuilt from the restored state.
     """
     is_event_handler = True
+    save_key = key.F5
+    load_key = key.F9
+    retry_key = key.BACKSPACE
 
-    def __init__(self, fn_show_message=None, fn_show_label=None):
+    def __init__(self, labels, fn_show_message=None, fn_show_label=None,
+                 seed=None, recorder=None, playback=None, bench=False, levels=None, level_index=0,
+                 rings=None, instant_hop=False, latency=None, pad_cache=True, throttle=False):
         super(Worldview, self).__init__()
+        self.labels = labels
         self.fn_show_message = fn_show_message
         self.fn_show_label = fn_show_label
 
@@ -162,514 +984,707 @@ class Worldview(cocos.layer.Layer):
         world = consts['world']
         self.width = world['width']  # world virtual width
         self.height = world['height']  # world virtual height
-        self.rPlayer = world['rPlayer']  # player radius in virtual space
-        self.wall_scale_min = world['wall_scale_min']
-        self.wall_scale_max = world['wall_scale_max']
-        self.topSpeed = world['topSpeed']
-        self.angular_velocity = world['angular_velocity']
-        self.accel = world['accel']
 
         # load resources:
-        pics = {}
-        pics["player"] = pyglet.resource.image('fly.png')
-        pics["pad"] = pyglet.resource.image('circle6.png')
-        pics["wall"] = pyglet.resource.image('circle6.png')
-        self.pics = pics
-
-        cell_size = self.rPlayer * self.wall_scale_max * 2.0 * 1.25
+        self.pics = load_pics()
 
         self.bindings = world['bindings']
-        buttons = {}
-        for k in self.bindings:
-            buttons[self.bindings[k]] = 0
-        self.buttons = buttons
-        self.upButtonReleased = True
-
-        self.schedule(self.update)
-        self.ladder_begin()
-        
-        self.specialPads = []
-        self.specialPadMessageDecay = 0.0
-        
-        self.backgroundLabelCount = 0
-        self.lastCompliment = ""
-        
 
-    def ladder_begin(self):
-        self.level_num = 0
-        self.empty_level()
-        msg = 'You are pretty fly'
-        self.fn_show_message(msg, callback=self.level_launch)
-
-    def level_launch(self):
-        self.generate_level()
-        #self.generate_random_level()
-        #msg = 'level %d' % self.level_num
-        #self.fn_show_message(msg, callback=self.level_start)
-        self.level_start()
-
-    def level_start(self):
-        self.win_status = 'undecided'
-
-    def level_complete(self):
-        self.win_status = 'complete'
-        
-        for child in self.get_children():
-            if child.btype == "pad":
-                child.stop()
-                child.do(ac.FadeOut(1))
-                
-        self.do(ac.Delay(15) + ac.CallFunc(self.ladder_begin))
-            
-            
-        # msg = 'level %d\nconquered !' % self.level_num
-        # self.fn_show_message(msg, callback=self.level_next)
-
-    def level_lost(self):
-        self.win_status = 'lost'
-        msg = 'You flew away!'
-        self.fn_show_message(msg, callback=self.ladder_begin)
-
-    def level_next(self):
-        self.empty_level()
-        self.level_num += 1
-        self.level_launch()
-
-    def empty_level(self):
-        # del old actors, if any
-        for node in self.get_children():
-            self.remove(node)
-        assert len(self.children) == 0
         self.player = None
-        self.gate = None
-        self.pad_cnt = 0
-        
-        self.specialPads = []
-        self.specialPadMessageDecay = 0.0
+        self.padSprites = []  # per sim pad, None while it is dormant
+        self.spareSprites = []  # pad sprites of dormant pads, hidden
+        self.padSpriteCount = 0  # awake and spare
+        self.padSpritesWanted = 0  # made ahead, between levels, up to this
+        self.awakeCells = None  # (ix0, iy0, ix1, iy1) of the pad grid cells with sprites
         self.backgroundLabelCount = 0
-        
-        self.swipeDecay = 0.0
-        self.swipeAngle = 0.0
-        self.swipePads = []
-        
-        self.compliments = [
-            "You are superb",
-            "You are #winning",
-            "You are tenacious",
-            "You are amazing",
-            "You are pretty fly",
-            "You are brilliant",
-            "You are incredible",
-            "You are dependable",
-            "You are reliable",
-            "You are sunshine",
-            "You are awesome",
-            "You are smart",
-            "You are dedicated",
-            "You are impeccable",
-            "You are strong",
-            "You are refreshing",
-            "You are deserving",
-            "You are helpful",
-            "You are courageous",
-            "You are funny",
-            "You are kind",
-            "You are great",
-            "You are joyful",
-            "You are wonderful",
-            "You are interesting",
-            "You are one of a kind",
-            "You are unique",
-            "You are fun",
-            "You are thoughtful",
-            "You are creative",
-            "You are trustworthy",
-            "You are lovely",
-            "You are stylish",
-            "You are special",
-            "You are inspiring",
-            "You are brave",
-            "You are charming",
-            "You are adorable",
-            "You are magnificent",
-            "You are generous",
-            "You are impressive",
-            "You are positive",  
-            "You are superlative",                        
-        ]
-
-        self.win_status = 'intermission'  # | 'undecided' | 'complete' | 'lost'
-
-        # player phys params
-        self.topSpeed = 150.0  # 50.
-        self.impulse_dir = eu.Vector2(0.0, 1.0)
-        self.impulseForce = 0.0
-
-    def rotatePoint(self, point, origin, angleDeg):
-        #Rotate a point counterclockwise by a given angle around a given origin.
-        ox, oy = origin.x, origin.y
-        px, py = point.x, point.y
-        angleRad = math.radians(angleDeg)
-
-        qx = ox + math.cos(angleRad) * (px - ox) - math.sin(angleRad) * (py - oy)
-        qy = oy + math.sin(angleRad) * (px - ox) + math.cos(angleRad) * (py - oy)
-        return eu.Point2(qx, qy)
-        
-    def add_pads(self, origin, padSize, radius):
-        circumference = math.pi * 2 * radius
-        numInCircle = math.floor(circumference / ((padSize * 2.0) + 2.0))
-        
-        pads = []
-        startPoint = eu.Point2(origin.x + radius, origin.y)
-        for i in range(0, numInCircle):
-            nextPoint = self.rotatePoint(startPoint, origin, (360 / numInCircle) * (i+1))
-            pad = Actor(nextPoint.x, nextPoint.y, padSize, 'pad', self.pics['pad'])
-            self.add(pad, z=100)
-            pad.disabled = False
-            pad.special = False
-            pad.specialTriggered = False
-            pad.spinning = False
-            pads.append(pad)
-            
-        return pads
-    
-
-    def generate_level(self):
-        # add player
-        origin = eu.Point2(0.5 * self.width, 0.5 * self.height)
-        self.player = Actor(origin.x, origin.y, self.rPlayer, 'player', self.pics['player'])
-        self.player.moveDecay = 0.0
-        self.player.currentPad = None
-        self.player.disabled = False
-        self.player.invincible = False
 
-        self.cnt_pad = 0
-        
-        padSize = 8.0
-        radius = 17.0
-        padsExclInner = []
-        
-        for i in range(1, 9):
-            addedPads = self.add_pads(origin, padSize, radius * i)
-            if i > 3:
-                padsExclInner += addedPads
-        
-        numSpecialPads = 6
-        for i in range(numSpecialPads):
-            chosenPad = random.choice(padsExclInner)
-            chosenPad.special = True
-            self.specialPads.append(chosenPad)
-            
-            
-        self.add(self.player, z=1000)
-        
+        # targets are the pad sprites in sim order, then the player
+        self.tweens = tween.Tweener()
+
+        # pads standing still share one vertex buffer, drawn from a cached
+        # texture of it while none of them change; pads being tweened move
+        # to the live batch, with the player, until they settle
+        self.batch = PadFieldCache() if pad_cache else cocos.batch.BatchNode()
+        self.add(self.batch, z=100)
+        self.liveBatch = cocos.batch.BatchNode()
+        self.add(self.liveBatch, z=101)
+        self.livePads = set()  # pad indices with their sprite in liveBatch
+        self.mergeInterval = 0.25  # seconds; settled pads go back together
+        self.nextMerge = 0.0
+
+        # over the field, with its own vertex list
+        self.swarm = SwarmNode(self.pics['player'], consts['view']['swarm'])
+        self.add(self.swarm, z=102)
+
+        # the simulation always advances in fixed ticks, whatever the
+        # display rate; the player is drawn interpolated between the last
+        # two ticks. The view's own randomness (jitter, label spots) is
+        # seeded along with the sim's so recordings reproduce
+        self.recorder = recorder
+        self.playback = playback
+        self.sim_time_owed = 0.0
+        self.max_catch_up = 0.25  # seconds; past this a slow frame drops time
+        # player state before the latest tick, kept as floats so ticking
+        # builds nothing
+        self.playerLast = False
+        self.lastX = self.lastY = self.lastRotation = 0.0
+        self.lastHopping = False
+        self.frame_times = [] if bench else None
+        self.rng = random.Random(seed)
+        # up starts the hop in the key handler rather than at the next tick
+        self.instant_hop = instant_hop
+        self.latency = latency  # a HopLatency, or None
+        # snapshots to go back to, see snapshot; none with a recording or a
+        # replay, whose steps can't jump
+        self.quickSave = None
+        self.checkpoints = collections.deque(maxlen=30)  # (sim time, snapshot), this level's
+        self.checkpointInterval = 1.0  # seconds of play between checkpoints
+        self.retryMargin = 2.0  # seconds; a retry goes back at least this far
+        self.nextCheckpoint = 0.0
+
+        self.sim = flysim.Simulation(listener=self.on_sim_event, seed=seed,
+                                     levels=levels, level_index=level_index, rings=rings)
+        # with throttle, frames stop while nothing moves, see IdlePacer
+        self.pacer = None
+        if throttle:
+            self.pacer = IdlePacer(self)
+            self.pacer.start()
+        else:
+            self.schedule(self.update)
+        self.sim.ladder_begin()
+
+        # lay the banners and compliments out a few a frame while the first
+        # banner scrolls, from the frame after the first one on
+        self.labelsToPrepare = [('banner', flysim.LOST_MESSAGE)]
+        for style in ('pad', 'background'):
+            self.labelsToPrepare.extend((style, text) for text in flysim.COMPLIMENTS)
+        self.labelsToPrepare.reverse()
+        self.labelsPerFrame = 2
+        director.window.push_handlers(on_draw=self.first_drawn)
+
+    def first_drawn(self):
+        # remove_handlers, as remove_handler can't match a bound method
+        director.window.remove_handlers(on_draw=self.first_drawn)
+        pyglet.clock.schedule_interval(self.prepare_labels, 1 / 60.0)
+
+    def prepare_labels(self, dt):
+        pending = self.labelsToPrepare
+        for _ in range(min(self.labelsPerFrame, len(pending))):
+            style, text = pending.pop()
+            self.labels.prepare(style, (text,))
+        if not pending:
+            pyglet.clock.unschedule(self.prepare_labels)
+
+    def on_sim_event(self, event, *args):
+        handler = getattr(self, 'sim_' + event, None)
+        if handler is not None:
+            handler(*args)
+
+    def sim_level_cleared(self):
+        # del old labels, actors stay for the next level
+        self.swarm.clear()
+        for node in self.get_children():
+            if node is self.batch or node is self.liveBatch or node is self.swarm:
+                continue
+            if getattr(node, 'btype', None) == "label":
+                self.labels.release(node)
+            else:
+                self.remove(node)
+        self.batch.visible = self.liveBatch.visible = False
+        self.backgroundLabelCount = 0
+        self.tweens.clear()
+
+    def sim_level_built(self, reused):
+        # pad sprites are pooled whether or not the pads were, so a new
+        # level starts with them all spare and the camera wakes its pads
+        sim = self.sim
+        self.playerLast = False
+        self.checkpoints.clear()
+        self.nextCheckpoint = 0.0
+        self.tweens.clear()
+        for index in list(self.livePads):
+            self.settle_pad(index)
+        for sprite in self.padSprites:
+            if sprite is not None:
+                sprite.visible = False
+                self.spareSprites.append(sprite)
+        self.padSprites = [None] * len(sim.pads)
+        self.awakeCells = None
+
+        player = sim.player
+        if self.player is None:
+            self.player = Actor(player.x, player.y, player.r, 'player', self.pics['player'])
+            self.liveBatch.add(self.player, z=1)
+        else:
+            self.player.reset(player.x, player.y)
+        self.batch.visible = self.liveBatch.visible = True
+        if isinstance(self.batch, PadFieldCache):
+            self.batch.resize(sim.width * scale_x, sim.height * scale_y)
+
+        # targets are the pad sprites in sim order, then the player
+        self.tweens.targets = self.padSprites + [self.player]
+        self.playerTarget = len(self.padSprites)
+        self.sync_player(0.0)
+
+    def sim_level_prepared(self, level):
+        # the sprites the next level opens with are made in the frames
+        # before it starts, see make_pad_sprites
+        x0, y0, x1, y1 = self.camera_cells(*self.camera_at(*self.sim.origin))
+        cells = level.padGrid.cells
+        wanted = 0
+        for ix in range(x0, x1 + 1):
+            for iy in range(y0, y1 + 1):
+                wanted += len(cells.get((ix, iy), ()))
+        self.padSpritesWanted = max(self.padSpritesWanted, wanted)
+
+    def make_pad_sprites(self, most):
+        """adds up to most spare pad sprites towards padSpritesWanted"""
+        for _ in range(min(most, self.padSpritesWanted - self.padSpriteCount)):
+            sprite = Actor(0, 0, flysim.rules['padSize'], 'pad', self.pics['pad'])
+            sprite.visible = False
+            self.batch.add(sprite, z=0)
+            self.spareSprites.append(sprite)
+            self.padSpriteCount += 1
+
+    def wake_pad(self, pad):
+        """gives pad a sprite, caught up with what it missed while dormant"""
+        if self.spareSprites:
+            sprite = self.spareSprites.pop()
+            sprite.reset(pad.x, pad.y)
+            sprite.visible = True
+        else:
+            sprite = Actor(pad.x, pad.y, pad.r, 'pad', self.pics['pad'])
+            self.batch.add(sprite, z=0)
+            self.padSpriteCount += 1
+        self.padSprites[pad.index] = self.tweens.targets[pad.index] = sprite
+
+        sim = self.sim
+        if pad.disabled:
+            sprite.scale = 0
+        if pad.specialTriggered:
+            sprite.color = Actor.palette['special']
+        if sim.win_status == 'complete':
+            sprite.opacity = 0
+        elif pad.spinning:
+            sprite.opacity = 0
+            left = sim.time_left(pad, sim.stopPadSpinning)
+            if left is not None:
+                self.tween_pad(pad.index, 'opacity', 0, 255, 0.2, delay=max(0.0, left - 0.2))
+        self.invalidate_field()
+
+    def sleep_pad(self, pad):
+        sprite = self.padSprites[pad.index]
+        if sprite is None:
+            return
+        self.tweens.cancel(pad.index)
+        if pad.index in self.livePads:
+            self.settle_pad(pad.index)
+        self.invalidate_field()
+        sprite.visible = False
+        self.padSprites[pad.index] = self.tweens.targets[pad.index] = None
+        self.spareSprites.append(sprite)
+
+    # the cached pad field
+
+    def caching(self):
+        return getattr(self.batch, 'caching', False)
+
+    def invalidate_field(self):
+        if self.caching():
+            self.batch.invalidate()
+
+    def tween_pad(self, index, prop, start, end, duration, delay=0.0, easing=tween.LINEAR):
+        """tweens a pad sprite, which is drawn live until it settles"""
+        if self.caching() and index not in self.livePads:
+            sprite = self.padSprites[index]
+            self.batch.remove(sprite)
+            self.liveBatch.add(sprite, z=0)
+            self.livePads.add(index)
+            self.batch.invalidate()
+        self.tweens.add(index, prop, start, end, duration, delay, easing)
+
+    def settle_pad(self, index):
+        """puts a live pad's sprite back in the cached field"""
+        sprite = self.padSprites[index]
+        self.livePads.discard(index)
+        self.liveBatch.remove(sprite)
+        self.batch.add(sprite, z=0)
+        self.batch.invalidate()
+
+    def settle_pads(self):
+        # pads whose tweens are over go back a few at a time, so the field
+        # isn't rendered again for every one of them
+        if not self.livePads or self.tweens.time < self.nextMerge:
+            return
+        busy = set(self.tweens.target)
+        settled = [i for i in self.livePads if i not in busy]
+        for index in settled:
+            self.settle_pad(index)
+        if settled:
+            self.nextMerge = self.tweens.time + self.mergeInterval
+
+    def camera_at(self, x, y):
+        """world point the camera centres on to follow world x, y"""
+        sim = self.sim
+        w, h = director.get_window_size()
+        half_w, half_h = 0.5 * w / scale_x, 0.5 * h / scale_y
+        cx = min(max(x, half_w), sim.width - half_w) if sim.width > 2 * half_w else 0.5 * sim.width
+        cy = min(max(y, half_h), sim.height - half_h) if sim.height > 2 * half_h else 0.5 * sim.height
+        return cx, cy
+
+    def camera_cells(self, cx, cy):
+        """(ix0, iy0, ix1, iy1) of the pad grid cells to keep awake around
+        a camera centred on cx, cy; a cell beyond the edges, so nothing
+        pops in"""
+        w, h = director.get_window_size()
+        half_w, half_h = 0.5 * w / scale_x, 0.5 * h / scale_y
+        cs = self.sim.cell_size
+        return (int((cx - half_w) // cs) - 1, int((cy - half_h) // cs) - 1,
+                int((cx + half_w) // cs) + 1, int((cy + half_h) // cs) + 1)
+
+    def follow(self, x, y):
+        """centres the camera on world x, y as far as the world allows, and
+        wakes and puts to sleep the pads it comes close to and leaves"""
+        sim = self.sim
+        w, h = director.get_window_size()
+        cx, cy = self.camera_at(x, y)
+        self.position = 0.5 * w - cx * scale_x, 0.5 * h - cy * scale_y
 
-    def nearestPad(self, fromPoint, toPoint, maxRange, exclPad):
-        shortestDistance = 999999.0
-        closestPad = None
-        
-        for child in self.get_children():
-            if child.btype == "pad" and child != exclPad and child.disabled == False and child.spinning == False:
-                padPoint = eu.Point2(child.position[0], child.position[1])
-                
-                # check angles to make sure it's ahead of us
-                targetDirection = (toPoint - fromPoint).normalize()
-                padDirection = (padPoint - fromPoint).normalize()
-                if targetDirection.angle(padDirection) < math.radians(40):
-
-                    distance = toPoint.distance(padPoint)
-                
-                    if distance < shortestDistance and distance < maxRange:
-                        shortestDistance = distance
-                        closestPad = child
-                    
-        return closestPad
-               
-    def startDisablePad(self, pad):
-        pad.disabled = True
-        
-        
-    def startPadJitter(self, pad):
+        cells = self.camera_cells(cx, cy)
+        old = self.awakeCells
+        if cells == old:
+            return
+        self.awakeCells = cells
+        grid = sim.padGrid.cells
+        x0, y0, x1, y1 = cells
+        if old is not None:
+            for ix in range(old[0], old[2] + 1):
+                for iy in range(old[1], old[3] + 1):
+                    if not (x0 <= ix <= x1 and y0 <= iy <= y1) and (ix, iy) in grid:
+                        for pad in grid[(ix, iy)]:
+                            self.sleep_pad(pad)
+        for ix in range(x0, x1 + 1):
+            for iy in range(y0, y1 + 1):
+                if (old is None or not (old[0] <= ix <= old[2] and old[1] <= iy <= old[3])) and (ix, iy) in grid:
+                    for pad in grid[(ix, iy)]:
+                        self.wake_pad(pad)
+
+    def sim_message(self, msg):
+        self.fn_show_message(msg)
+
+    def sim_level_complete(self):
+        player = self.sim.player
+        self.swarm.release(player.x, player.y, self.rng)
+        self.tweens.clear()
+        for i, sprite in enumerate(self.padSprites):
+            if sprite is not None:
+                self.tween_pad(i, 'opacity', 255, 0, 1)
+
+    def sim_special_triggered(self, pad, compliment):
+        sprite = self.padSprites[pad.index]
+        if sprite is not None:
+            sprite.color = Actor.palette['special']
+            if pad.index not in self.livePads:
+                self.invalidate_field()
+        self.showMessageInBackground(compliment)
+
+    def sim_pad_jitter(self, pad):
         def randomJitter():
             maxJitter = 2
             maxJitterDoubled = 2 * maxJitter
-        
-            return (random.randint(0, maxJitterDoubled) - maxJitter, random.randint(0, maxJitterDoubled) - maxJitter)
-            
-        if self.player.currentPad == pad:
-            jitterTime = 0.05
-        
-            move1 = ac.MoveBy(randomJitter(), jitterTime)
-            move2 = ac.MoveBy(randomJitter(), jitterTime)
-            move3 = ac.MoveBy(randomJitter(), jitterTime)
-            move4 = ac.MoveBy(randomJitter(), jitterTime)
-        
-            pad.do((move1 + ac.Reverse(move1) + move2 + ac.Reverse(move2) + move3 + ac.Reverse(move3) + move4 + ac.Reverse(move4)) * 3)
-            pad.do(ac.Delay(1) + ac.CallFuncS(self.endDisablePad))
-        
-        
-    def endDisablePad(self, pad):
-        pad.disabled = True
-        pad.do(ac.ScaleTo(0, 1))
-        
-        if self.player.currentPad == pad and not self.player.invincible:
-            
-            self.player.currentPad = None
-            self.player.disabled = True
-            
-            self.player.do(ac.ScaleTo(0, 1) + ac.CallFunc(self.level_lost))
-            
-        
-    def enablePad(self, pad):
-        pad.disabled = False
-        
-    def stopPadSpinning(self, pad):
-        pad.spinning = False
-        
-    def showMessageOnPad(self, pad):
-        self.lastCompliment = random.choice(self.compliments)
-        self.compliments.remove(self.lastCompliment)
-        
-        label = cocos.text.Label(self.lastCompliment,
-                                font_size=20,
-                                font_name=consts['view']['font_name'],
-                                anchor_y='center',
-                                anchor_x='center',
-                                width=600,
-                                multiline=False,
-                                align="center")
-        label.position = (pad.position[0] + (random.randint(0, 140) - 70), pad.position[1] + (random.randint(0, 140) - 70))
-        label.btype = "label"
+
+            return (self.rng.randint(0, maxJitterDoubled) - maxJitter, self.rng.randint(0, maxJitterDoubled) - maxJitter)
+
+        jitterTime = 0.05
+        sprite = self.padSprites[pad.index]
+        if sprite is None:
+            return
+        x, y = sprite.position
+
+        # four moves out and back, three times over
+        moves = [randomJitter() for _ in range(4)]
+        for repeat in range(3):
+            for i, (dx, dy) in enumerate(moves):
+                delay = (repeat * 4 + i) * 2 * jitterTime
+                if dx:
+                    self.tween_pad(pad.index, 'x', x, x + dx, 2 * jitterTime, delay, tween.PINGPONG)
+                if dy:
+                    self.tween_pad(pad.index, 'y', y, y + dy, 2 * jitterTime, delay, tween.PINGPONG)
+
+    def sim_pad_collapse(self, pad):
+        sprite = self.padSprites[pad.index]
+        if sprite is not None:
+            self.tween_pad(pad.index, 'scale', sprite.scale, 0, 1)
+
+    def sim_hop(self, pad):
+        if self.latency is not None:
+            self.latency.hop()
+
+    def sim_player_fall(self):
+        self.tweens.add(self.playerTarget, 'scale', self.player.scale, 0, 1)
+
+    def sim_pad_spin(self, pad):
+        if self.padSprites[pad.index] is not None:
+            self.tween_pad(pad.index, 'opacity', 255, 0, 0.2)
+            self.tween_pad(pad.index, 'opacity', 0, 255, 0.2, delay=1.7)
+
+    def sim_compliment(self, pad, compliment):
+        self.showMessageOnPad(world_to_view(pad), compliment)
+
+    def showMessageOnPad(self, position, compliment):
+        # the label goes over the world, so it takes the camera into account
+        x, y = position[0] + self.x, position[1] + self.y
+        label = self.labels.acquire('pad', compliment)
+        label.position = (x + (self.rng.randint(0, 140) - 70), y + (self.rng.randint(0, 140) - 70))
 
         self.fn_show_label(label)
-        label.do(ac.Show() + ac.ScaleTo(4, 2) | ac.FadeOut(2))
-        
+        self.labels.play(label, ac.Show() + ac.ScaleTo(4, 2) | ac.FadeOut(2))
+
     def showMessageInBackground(self, msg):
         w, h = director.get_window_size()
 
-        label = cocos.text.Label(self.lastCompliment,
-                                font_size=50,
-                                font_name=consts['view']['font_name'],
-                                anchor_y='center',
-                                anchor_x='center',
-                                width=self.width,
-                                multiline=False,
-                                align="center")
-        label.position = (w * 0.5, (h - ((h / 6) * self.backgroundLabelCount)) - 30)
-        label.btype = "label"
-        
+        label = self.labels.acquire('background', msg)
+        # placed on screen, then left behind in the world as the camera moves
+        label.position = (w * 0.5 - self.x, (h - ((h / 6) * self.backgroundLabelCount)) - 30 - self.y)
+
         label.do(ac.Show() + ac.FadeIn(2))
         self.add(label)
-        
-        self.backgroundLabelCount += 1
-
-    def updatePlayerFlyingWin(self, dt):
-        buttons = self.buttons
-        ma = buttons['right'] - buttons['left']
-        if ma != 0:
-            self.player.rotation += ma * dt * self.angular_velocity
-            a = math.radians(self.player.rotation)
-            self.impulse_dir = eu.Vector2(math.sin(a), math.cos(a))
-
-        newVel = self.player.vel
-        mv = buttons['up']
-        if mv != 0:
-            newVel += dt * mv * self.accel * self.impulse_dir
-            nv = newVel.magnitude()
-            if nv > self.topSpeed:
-                newVel *= self.topSpeed / nv
-                
-        ppos = self.player.cshape.center
-        newPos = ppos
-        r = self.player.cshape.r
-        while dt > 1.e-6:
-            newPos = ppos + dt * newVel
-            consumed_dt = dt
-            # what about screen boundaries ? if colision bounce
-            if newPos.x < r:
-                consumed_dt = (r - ppos.x) / newVel.x
-                newPos = ppos + consumed_dt * newVel
-                newVel = -reflection_y(newVel)
-            if newPos.x > (self.width - r):
-                consumed_dt = (self.width - r - ppos.x) / newVel.x
-                newPos = ppos + consumed_dt * newVel
-                newVel = -reflection_y(newVel)
-            if newPos.y < r:
-                consumed_dt = (r - ppos.y) / newVel.y
-                newPos = ppos + consumed_dt * newVel
-                newVel = reflection_y(newVel)
-            if newPos.y > (self.height - r):
-                consumed_dt = (self.height - r - ppos.y) / newVel.y
-                newPos = ppos + consumed_dt * newVel
-                newVel = reflection_y(newVel)
-            dt -= consumed_dt
-
-        self.player.vel = newVel
-        self.player.update_center(newPos)        
-        
-    def updateRadarSwipe(self, dt):
-        self.swipeDecay -= dt
-        if self.swipeDecay < 0.0:
-            
-            self.swipeDecay = 0.2
-            
-            self.swipeAngle -= 3.0
-            if self.swipeAngle < 0:
-                self.swipeAngle += 360
-                self.swipePads = [x for x in self.get_children() if x.btype == "pad" and x.disabled == False]
-                
-            padsToRemove = []
-            w, h = director.get_window_size()
-            origin = eu.Point2(0.5 * w, 0.5 * h)
-            rightOfOrigin = eu.Point2(origin.x + 600.0, origin.y)
-            # startVector = (rightOfOrigin - origin).normalize()
-            # startVector = startVector.rotate(math.radians(self.swipeAngle))
-            endPoint = self.rotatePoint(rightOfOrigin, origin, self.swipeAngle)
-            
-            #print("testing pads", len(self.swipePads), "at angle", self.swipeAngle)
-            swipeLine = eu.LineSegment2(origin, endPoint)
-            
-            # line = draw.Line((swipeLine.p1.x, swipeLine.p1.y), (swipeLine.p2.x, swipeLine.p2.y), (255, 255, 255, 255))
-            # line.btype = "line"
-            # self.add(line)
-            
-            for pad in self.swipePads:
-                circle = eu.Circle(eu.Point2(pad.position[0], pad.position[1]), 8.0)
-                if swipeLine.intersect(circle) != None and not pad.specialTriggered:
-                    padsToRemove.append(pad)
-                    pad.spinning = True
-                    pad.do(ac.FadeOut(0.2) + ac.Delay(1.5) + ac.FadeIn(0.2) + ac.CallFuncS(self.stopPadSpinning))
-            
-            for pad in padsToRemove:
-                self.swipePads.remove(pad)
-                    
-            
 
+        self.backgroundLabelCount += 1
 
     def update(self, dt):
-        # if not playing dont update model
-        if self.win_status != 'undecided':
-            if self.win_status == 'complete':
-                self.updatePlayerFlyingWin(dt)
+        if self.frame_times is not None:
+            self.frame_times.append(dt)
+
+        tick = self.sim.tick
+        self.sim_time_owed = min(self.sim_time_owed + dt, self.max_catch_up)
+        while self.sim_time_owed >= tick:
+            self.sim_time_owed -= tick
+            player = self.sim.player
+            if player is not None:
+                self.playerLast = True
+                self.lastX, self.lastY, self.lastRotation = player.x, player.y, player.rotation
+                self.lastHopping = player.hopping
+            self.step_sim(tick)
+        self.tweens.step(dt)
+        self.settle_pads()
+        self.step_swarm(dt)
+        self.sync_player(self.sim_time_owed / tick)
+        if self.padSpriteCount < self.padSpritesWanted and self.sim.win_status != 'undecided':
+            self.make_pad_sprites(32)
+
+    def engaged(self):
+        """True while keys are held, the fly moves or input comes from
+        elsewhere"""
+        sim = self.sim
+        player = sim.player
+        if self.playback is not None or any(sim.buttons.values()) or self.lastHopping:
+            return True
+        return player is not None and (player.hopping or player.vel_x != 0.0 or player.vel_y != 0.0)
+
+    def still(self):
+        """True when nothing on screen is changing or about to, short of
+        something the simulation has due"""
+        if self.engaged() or self.sim.staging is not None:
+            return False
+        # tweens waiting out a delay leave their pads as they are; live
+        # pads that have settled look the same merged or not
+        if self.tweens.next_change() == 0.0 or self.swarm.visible:
+            return False
+        if self.padSpriteCount < self.padSpritesWanted:
+            return False
+        return not acting(self.parent)
+
+    def idle_wait(self, longest):
+        """seconds until the simulation has something due or a tween
+        starts, at most longest"""
+        sim = self.sim
+        wait = longest
+        due = sim.next_due()
+        if due is not None:
+            wait = min(wait, max(due - sim.time - self.sim_time_owed, sim.tick))
+        start = self.tweens.next_change()
+        if start is not None:
+            wait = min(wait, start)
+        return wait
+
+    def step_swarm(self, dt):
+        self.swarm.step(dt, self.sim.width, self.sim.height)
+
+    def sync_player(self, alpha):
+        """places the player sprite alpha of a tick past the latest state"""
+        player = self.sim.player
+        if self.player is None or player is None:
             return
-
-        self.updateRadarSwipe(dt)
-
-        # check distances to the special pads
-        if self.specialPadMessageDecay > 0.0:
-            self.specialPadMessageDecay -= dt
+        if self.instant_hop and (player.hopping or self.lastHopping):
+            # hops are drawn from their own start and end, a tick ahead of
+            # interpolating, so one started by the key handler shows on the
+            # next frame; a hop that ended in the latest tick is over
+            x, y, rotation = player.x, player.y, player.rotation
+            if player.hopping:
+                t = min(1.0, (player.hop_elapsed + alpha * self.sim.tick) / player.hop_duration)
+                x = player.hop_x0 + (player.hop_x1 - player.hop_x0) * t
+                y = player.hop_y0 + (player.hop_y1 - player.hop_y0) * t
+        elif not self.playerLast:
+            x, y, rotation = player.x, player.y, player.rotation
         else:
-            for p in self.specialPads:
-                if p.specialTriggered == False:
-                    padPoint = eu.Point2(p.position[0], p.position[1])
-                    playerPos = eu.Point2(self.player.position[0], self.player.position[1])
-
-                    if padPoint != playerPos:           # this is daft but euclid crashes when calling distance on two points that are the same
-                        distance = playerPos.distance(padPoint)
-            
-                        if distance < 80:
-                            self.showMessageOnPad(p)
-                            self.specialPadMessageDecay = 2
-                            break
-
-
-        # update player
-            
-        buttons = self.buttons
-        ma = buttons['right'] - buttons['left']
-        if ma != 0:
-            self.player.rotation += ma * dt * self.angular_velocity
-            a = math.radians(self.player.rotation)
-            self.impulse_dir = eu.Vector2(math.sin(a), math.cos(a))
-
-        newVel = self.player.vel
-        mv = buttons['up']
-        
-        if self.player.moveDecay > -1.0:
-            self.player.moveDecay -= dt
-            
-            # newVel += dt * self.accel * self.player.moveDecay * 0.5 * self.impulse_dir
-  
-        if mv == 0 and self.player.moveDecay < 0.0:
-            self.upButtonReleased = True         
-        
-        if mv != 0 and (self.upButtonReleased or self.player.moveDecay < -0.2) and not self.player.disabled:
-            self.upButtonReleased = False
-            
-            moveDuration = 0.25
-            self.player.moveDecay = moveDuration
-            
-            #print("cshape.center: ", self.player.cshape.center)
-            playerPos = eu.Point2(self.player.position[0], self.player.position[1])
-            futurePos = playerPos + (self.impulse_dir * 30)
-            
-            nearestPad = self.nearestPad(playerPos, futurePos, 30, self.player.currentPad)
-            if nearestPad != None:
-                futurePos = eu.Point2(nearestPad.position[0], nearestPad.position[1])
-                self.player.currentPad = nearestPad
-
-                if nearestPad.special:
-                    if not nearestPad.specialTriggered:
-                        nearestPad.color = Actor.palette['special']
-                        nearestPad.specialTriggered = True
-                
-                        self.showMessageInBackground(self.lastCompliment)
-                        
-                        padsUntriggered = [p for p in self.specialPads if p.specialTriggered == False]
-                        if len(padsUntriggered) == 0:
-                            self.do(ac.Delay(3) + ac.CallFunc(self.level_complete))
-                            #self.level_complete()
-                    
-                else:                
-                    nearestPad.do(ac.Delay(0.8) + ac.CallFuncS(self.startPadJitter)) #+ ac.Delay(1) + ac.CallFuncS(self.endDisablePad))
-                    # action = ac.CallFuncS(self.startDisablePad) + ac.FadeOut(2) + ac.CallFuncS(self.endDisablePad) + ac.RandomDelay(10, 25) + ac.CallFuncS(self.enablePad) + ac.FadeIn(1)
-                    # nearestPad.do(action)
-                    
-                move = ac.MoveTo((futurePos.x, futurePos.y), duration = moveDuration)
-                self.player.do(move)
-            else:
-                self.player.currentPad = None
-                self.player.disabled = True
-                
-                move = ac.MoveTo((futurePos.x, futurePos.y), duration = moveDuration)
-                self.player.do(move | ac.ScaleTo(0, 1) + ac.CallFunc(self.level_lost))
+            lx, ly, lr = self.lastX, self.lastY, self.lastRotation
+            x = lx + (player.x - lx) * alpha
+            y = ly + (player.y - ly) * alpha
+            rotation = lr + (player.rotation - lr) * alpha
+        self.player.position = x * scale_x, y * scale_y
+        self.player.rotation = rotation
+        self.follow(x, y)
+        if self.latency is not None:
+            self.latency.frame(self.player.position)
+
+    def step_sim(self, dt):
+        if self.playback is not None:
+            if self.playback.done(self.sim):
+                self.playback_finished()
+                return
+            self.playback.apply(self.sim)
+        self.sim.step(dt)
+        sim = self.sim
+        if sim.win_status == 'undecided' and sim.time >= self.nextCheckpoint and self.rewindable():
+            self.checkpoint()
+
+    def playback_finished(self):
+        self.playback = None
+        if self.frame_times is not None:
+            import instrument
+            print("frames: " + instrument.format_stats(instrument.frame_stats(self.frame_times)))
+            pyglet.app.exit()
+
+    def set_button(self, name, value):
+        if self.playback is not None:
+            return
+        if self.recorder is not None:
+            self.recorder.button(self.sim.steps, name, value)
+        self.sim.set_button(name, value)
 
-        
-        playerWorldPos = view_to_world(self.player.position[0], self.player.position[1])
-        self.player.cshape.center = eu.Vector2(playerWorldPos[0], playerWorldPos[1])
+    # snapshots
 
+    def rewindable(self):
+        return self.recorder is None and self.playback is None
 
-    def open_gate(self):
-        self.gate.color = Actor.palette['gate']
+    def checkpoint(self):
+        sim = self.sim
+        self.checkpoints.append((sim.time, snapshot.take(sim)))
+        self.nextCheckpoint = sim.time + self.checkpointInterval
+
+    def retry(self):
+        """back to the newest checkpoint at least retryMargin seconds old,
+        or the level's first; retrying again goes further back"""
+        sim = self.sim
+        if not self.checkpoints:
+            return
+        for when, data in reversed(self.checkpoints):
+            if when <= sim.time - self.retryMargin:
+                break
+        self.restore(data)
+
+    def restore(self, data):
+        """puts the simulation back to a snapshot and rebuilds the view
+        from it; effects under way then are not brought back"""
+        sim = self.sim
+        checkpoints = list(self.checkpoints)  # level_built clears them
+        snapshot.restore(sim, data)
+        # the keys held then aren't now
+        for name in sim.buttons:
+            sim.set_button(name, 0)
+        self.sim_level_cleared()
+        player = sim.player
+        if player is not None:
+            self.sim_level_built(True)
+            if player.disabled:
+                self.player.scale = 0
+            if sim.win_status == 'complete':
+                self.swarm.release(player.x, player.y, self.rng)
+        # checkpoints past the restored time belong to another branch
+        self.checkpoints.clear()
+        self.checkpoints.extend(c for c in checkpoints if c[0] <= sim.time)
+        self.nextCheckpoint = sim.time + self.checkpointInterval
+        self.sim_time_owed = 0.0
+        self.lastHopping = False
+
+    def on_snapshot_key(self, k):
+        if k == self.save_key:
+            self.quickSave = snapshot.take(self.sim)
+        elif k == self.load_key:
+            if self.quickSave is not None:
+                self.restore(self.quickSave)
+        elif k == self.retry_key:
+            self.retry()
+        else:
+            return False
+        return True
 
     def on_key_press(self, k, m):
+        if self.pacer is not None:
+            self.pacer.wake()
+        if self.rewindable() and self.on_snapshot_key(k):
+            return True
         binds = self.bindings
         if k in binds:
-            self.buttons[binds[k]] = 1
+            name = binds[k]
+            if name == 'up' and not self.sim.buttons['up']:
+                if self.latency is not None and self.player is not None:
+                    self.latency.press(self.player.position)
+                if self.instant_hop and self.playback is None and self.recorder is None:
+                    self.sim.hop_now()
+                    return True
+            self.set_button(name, 1)
             return True
         return False
 
     def on_key_release(self, k, m):
         binds = self.bindings
         if k in binds:
-            self.buttons[binds[k]] = 0
+            self.set_button(binds[k], 0)
             return True
         return False
 
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="You Are Fly")
+    parser.add_argument('--draw-calls', action='store_true',
+                        help="print GL draw calls per frame once a second")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="seed for every random choice")
+    parser.add_argument('--record', metavar='LOG',
+                        help="record input and seed to LOG")
+    parser.add_argument('--replay', metavar='LOG',
+                        help="play back a recorded LOG instead of taking input")
+    parser.add_argument('--bench', action='store_true',
+                        help="with --replay: no vsync, print frame times and quit at the end")
+    parser.add_argument('--stats', action='store_true',
+                        help="start with the frame timing overlay on (F3 toggles it)")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="time every frame and write them to FILE (.csv or .json) on exit")
+    parser.add_argument('--startup-report', action='store_true',
+                        help="print startup times and quit once the first frame is up")
+    parser.add_argument('--startup-budget', type=float, metavar='SECONDS',
+                        help="with --startup-report: exit with status 1 if the first frame took longer")
+    parser.add_argument('--pack', metavar='PACK',
+                        help="play the levels of a level pack instead of generating them")
+    parser.add_argument('--level', type=int, default=0,
+                        help="with --pack: entry to start from")
+    parser.add_argument('--arena', type=int, metavar='RINGS',
+                        help="a large arena of RINGS rings that the camera scrolls around")
+    parser.add_argument('--latency', action='store_true',
+                        help="time key presses to the fly moving and print a histogram on exit")
+    parser.add_argument('--instant-hop', action='store_true',
+                        help="start hops in the key handler instead of at the next tick")
+    parser.add_argument('--no-pad-cache', dest='pad_cache', action='store_false',
+                        help="draw every pad every frame instead of caching the still ones in a texture")
+    parser.add_argument('--no-throttle', dest='throttle', action='store_false',
+                        help="update and draw every frame, even while nothing on screen moves")
+    parser.add_argument('--soak', type=int, metavar='CYCLES',
+                        help="let a bot play CYCLES ladders, then exit with status 1 if memory or nodes grew")
+    parser.add_argument('--soak-speed', type=float, default=10.0, metavar='FACTOR',
+                        help="with --soak: how much faster than real time to run")
+    parser.add_argument('--idle-check', type=float, metavar='SECONDS',
+                        help="count frames drawn over SECONDS without input, then exit with status 1 if any came without an update")
+    args = parser.parse_args(argv)
+    if (args.pack or args.arena) and (args.record or args.replay):
+        # a log only names the seed, so it can't bring its levels back
+        parser.error("--pack and --arena can't be combined with --record or --replay")
+    if args.arena is not None and args.arena <= flysim.rules['innerRings']:
+        # special pads are only picked outside the inner rings
+        parser.error("--arena needs more than %d rings" % flysim.rules['innerRings'])
+    if args.instant_hop and (args.record or args.replay):
+        # a hop between ticks isn't a button change a log can replay
+        parser.error("--instant-hop can't be combined with --record or --replay")
+    if args.soak is not None:
+        if args.record or args.replay:
+            parser.error("--soak plays by itself, without --record or --replay")
+        if args.soak < 8:
+            parser.error("--soak needs at least 8 cycles to compare")
+    if args.idle_check is not None:
+        if args.record or args.replay or args.soak or args.bench:
+            parser.error("--idle-check needs the game left to itself")
+        if not args.throttle:
+            parser.error("--idle-check measures the throttle, without --no-throttle")
+        if args.idle_check <= 0:
+            parser.error("--idle-check needs a positive number of seconds")
+
+    seed = args.seed
+    recorder = None
+    playback = None
+    if args.replay or args.record:
+        import replay
+    if args.replay:
+        playback = replay.Replay.load(args.replay)
+        seed = playback.seed
+    elif args.record:
+        if seed is None:
+            seed = random.randrange(2 ** 31)
+        recorder = replay.Recorder(args.record, seed, flysim.rules['tick'])
+    levels = None
+    if args.pack:
+        import levelpack
+        levels = levelpack.LevelPack(args.pack)
+        if not 0 <= args.level < len(levels):
+            parser.error("%s has %d levels" % (args.pack, len(levels)))
+
+    window = dict(consts['window'])
+    if args.bench or args.soak:
+        window['vsync'] = False
+    if args.soak:
+        speed_up_clock(args.soak_speed)
+
     # make window
-    director.init(**consts['window'])
+    director.init(**window)
+    startup['window'] = time.perf_counter()
+    report = None
+    if args.startup_report or args.startup_budget is not None:
+        report = StartupReport(args.startup_budget, quit=args.startup_report)
+        report.install(director.window)
+    if args.draw_calls:
+        DrawCallCounter().install()
     #pyglet.font.add_directory('.') # adjust as necessary if font included
     scene = cocos.scene.Scene()
     palette = consts['view']['palette']
     Actor.palette = palette
     r, g, b = palette['bg']
     scene.add(cocos.layer.ColorLayer(r, g, b, 255), z=-1)
-    message_layer = MessageLayer()
+    labels = LabelPool(consts['view']['labels'])
+    message_layer = MessageLayer(labels)
     scene.add(message_layer, z=1)
-    playview = Worldview(fn_show_message=message_layer.show_message, fn_show_label=message_layer.show_label)
+    playview = Worldview(labels, fn_show_message=message_layer.show_message, fn_show_label=message_layer.show_label,
+                         seed=seed, recorder=recorder, playback=playback, bench=args.bench and playback is not None,
+                         levels=levels, level_index=args.level, rings=args.arena,
+                         instant_hop=args.instant_hop, latency=HopLatency() if args.latency else None,
+                         pad_cache=args.pad_cache, throttle=args.throttle and not args.bench)
     scene.add(playview, z=0)
+    soak = Soak(playview, labels, args.soak) if args.soak else None
+    idle_check = IdleCheck(playview, args.idle_check, report) if args.idle_check else None
+
+    stats_layer = StatsLayer(playview, scene)
+    scene.add(stats_layer, z=2)
+    if args.trace:
+        stats_layer.start_trace()
+    if args.stats:
+        stats_layer.show(True)
+
     director.run(scene)
 
-main()
+    if args.trace:
+        stats_layer.profiler.export(args.trace)
+
+    if recorder is not None:
+        recorder.close(playview.sim.steps)
+
+    if args.latency:
+        print("hop latency:\n" + playview.latency.histogram.format())
+
+    if soak is not None and soak.failed:
+        return 1
+    if idle_check is not None and idle_check.failed:
+        return 1
+    return 1 if report is not None and report.over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,45 @@
+from __future__ import division, print_function, unicode_literals
+
+"""Allocation-free 2d helpers for the per-tick paths
+
+Everything takes plain floats rather than point tuples, so nothing is built
+per call, and distances are compared squared so no square root is taken
+where a comparison will do. Coincident points are fine everywhere: their
+distance is simply 0, and a zero length direction is never ahead.
+"""
+
+import math
+
+
+def dist2(ax, ay, bx, by):
+    dx = ax - bx
+    dy = ay - by
+    return dx * dx + dy * dy
+
+
+def within(ax, ay, bx, by, r):
+    """True when the points are less than r apart"""
+    dx = ax - bx
+    dy = ay - by
+    return dx * dx + dy * dy < r * r
+
+
+def ahead(dx, dy, px, py, cos_cone):
+    """True when (px, py) is strictly within the cone of half angle
+    acos(cos_cone) around the direction (dx, dy); needs cos_cone >= 0.
+
+    A zero length vector has no direction and is never ahead.
+    """
+    dot = dx * px + dy * py
+    if dot <= 0.0:
+        return False
+    return dot * dot > cos_cone * cos_cone * (dx * dx + dy * dy) * (px * px + py * py)
+
+
+def rotate_point(px, py, ox, oy, degrees):
+    """(px, py) rotated counterclockwise around (ox, oy)"""
+    a = math.radians(degrees)
+    c = math.cos(a)
+    s = math.sin(a)
+    return ox + c * (px - ox) - s * (py - oy), oy + s * (px - ox) + c * (py - oy)
+
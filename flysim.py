@@ -0,0 +1,1048 @@
+from __future__ import division, print_function, unicode_literals
+
+"""Window-free game rules for You Are Fly
+
+Nothing in here imports pyglet or cocos, so a Simulation can be stepped on
+machines without a display. fly.Worldview is a view over one of these.
+
+Everything is in world units (see rules["width"] / rules["height"]); the
+view scales by 2 on both axes, so the old pixel constants are halved here.
+"""
+
+import sys
+import time
+import math
+import random
+import heapq
+import bisect
+
+import flymath
+
+rules = {
+    "width": 400.0,
+    "height": 300.0,
+    "rPlayer": 8.0,
+    "tick": 1.0 / 60.0,  # default fixed step, seconds
+
+    # level layout
+    "padSize": 8.0,
+    "ringSpacing": 17.0,
+    "rings": 8,
+    "innerRings": 3,  # special pads are never picked from these
+    "numSpecialPads": 6,
+
+    # player
+    "angular_velocity": 300.0,  # degrees / s
+    "accel": 200.0,
+    "topSpeed": 150.0,
+    "hopDuration": 0.25,
+    "hopRepeat": 0.2,  # holding up re-hops this long after landing
+    "hopReach": 15.0,
+    "hopCone": 40.0,  # degrees either side of the heading
+    "fallTime": 1.0,
+
+    # pads
+    "jitterDelay": 0.8,
+    "collapseDelay": 1.0,
+
+    # special pads
+    "specialRange": 40.0,
+    "specialMessageDecay": 2.0,
+    "completeDelay": 3.0,
+    "celebrationTime": 15.0,
+
+    # radar
+    "swipeInterval": 0.2,
+    "swipeStep": 3.0,  # degrees per swipe, clockwise
+    "swipeLength": 300.0,
+    "swipePadRadius": 4.0,
+    "spinTime": 1.9,
+
+    # banner messages take this long to scroll past
+    "messageTime": 2.0,
+
+    # the next level is built about this many pads per step while nothing is
+    # played; 80 rings are ready within the 2 s greeting at this rate
+    "stageChunk": 1024,
+}
+
+GREETING = "You are pretty fly"
+LOST_MESSAGE = "You flew away!"
+
+COMPLIMENTS = (
+    "You are superb",
+    "You are #winning",
+    "You are tenacious",
+    "You are amazing",
+    "You are pretty fly",
+    "You are brilliant",
+    "You are incredible",
+    "You are dependable",
+    "You are reliable",
+    "You are sunshine",
+    "You are awesome",
+    "You are smart",
+    "You are dedicated",
+    "You are impeccable",
+    "You are strong",
+    "You are refreshing",
+    "You are deserving",
+    "You are helpful",
+    "You are courageous",
+    "You are funny",
+    "You are kind",
+    "You are great",
+    "You are joyful",
+    "You are wonderful",
+    "You are interesting",
+    "You are one of a kind",
+    "You are unique",
+    "You are fun",
+    "You are thoughtful",
+    "You are creative",
+    "You are trustworthy",
+    "You are lovely",
+    "You are stylish",
+    "You are special",
+    "You are inspiring",
+    "You are brave",
+    "You are charming",
+    "You are adorable",
+    "You are magnificent",
+    "You are generous",
+    "You are impressive",
+    "You are positive",
+    "You are superlative",
+)
+
+BUTTONS = ('left', 'right', 'up')
+
+
+class Pad(object):
+
+    __slots__ = ('index', 'x', 'y', 'r', 'ring', 'disabled', 'special', 'specialTriggered',
+                 'spinning', 'sweptRevolution', 'timers')
+
+    def __init__(self, index, x, y, r, ring):
+        self.index = index
+        self.x = x
+        self.y = y
+        self.r = r
+        self.ring = ring
+        self.disabled = False
+        self.special = False
+        self.specialTriggered = False
+        self.spinning = False
+        self.sweptRevolution = -1  # last radar revolution that spun this pad
+        self.timers = []
+
+    def reset(self):
+        self.disabled = False
+        self.special = False
+        self.specialTriggered = False
+        self.spinning = False
+        self.sweptRevolution = -1
+        del self.timers[:]
+
+
+class Player(object):
+
+    __slots__ = ('x', 'y', 'r', 'rotation', 'vel_x', 'vel_y', 'moveDecay', 'currentPad',
+                 'disabled', 'invincible', 'hopping',
+                 'hop_x0', 'hop_y0', 'hop_x1', 'hop_y1', 'hop_elapsed', 'hop_duration')
+
+    def __init__(self, x, y, r):
+        self.r = r
+        self.reset(x, y)
+
+    def reset(self, x, y):
+        self.x = x
+        self.y = y
+        self.rotation = 0.0  # degrees, clockwise like cocos
+        self.vel_x = 0.0
+        self.vel_y = 0.0
+        self.moveDecay = 0.0
+        self.currentPad = None
+        self.disabled = False
+        self.invincible = False
+        # a hop runs from (hop_x0, hop_y0) to (hop_x1, hop_y1) while hopping
+        self.hopping = False
+        self.hop_x0 = self.hop_y0 = self.hop_x1 = self.hop_y1 = 0.0
+        self.hop_elapsed = self.hop_duration = 0.0
+
+
+class PadGrid(object):
+
+    """Uniform grid of pads bucketed by centre, for lookups around a point"""
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def clear(self):
+        self.cells.clear()
+
+    def insert(self, pad):
+        cs = self.cell_size
+        key = (int(math.floor(pad.x / cs)), int(math.floor(pad.y / cs)))
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = []
+        cell.append(pad)
+
+    def cells_around(self, x, y, radius, found):
+        """fills found with the pad lists of the cells overlapping the square
+        of half side radius; found is the caller's, reused between calls"""
+        cs = self.cell_size
+        cells = self.cells
+        ix0 = int(math.floor((x - radius) / cs))
+        ix1 = int(math.floor((x + radius) / cs))
+        iy0 = int(math.floor((y - radius) / cs))
+        iy1 = int(math.floor((y + radius) / cs))
+        del found[:]
+        for ix in range(ix0, ix1 + 1):
+            for iy in range(iy0, iy1 + 1):
+                cell = cells.get((ix, iy))
+                if cell is not None:
+                    found.append(cell)
+        return found
+
+
+class SweepSchedule(object):
+
+    """Pads sorted by polar angle around the radar origin, ring by ring
+
+    The swipe is a segment out of the origin, so a pad at distance d can only
+    be touched while the swipe is within asin(r / d) degrees of its angle.
+    Each ring gets its own window, narrower the further out it is, so a swipe
+    looks at a few pads per ring however many pads the rings hold.
+    """
+
+    def __init__(self, origin, pad_radius):
+        self.origin = origin
+        self.pad_radius = pad_radius
+        self.clear()
+
+    def clear(self):
+        # (angles, pads twice over so a window across 0 degrees is one run,
+        #  reach in degrees, distance of the nearest pad) per ring
+        self.bands = []
+
+    def build(self, pads):
+        self.clear()
+        for ring in by_ring(pads):
+            self.add_ring(ring)
+
+    def add_ring(self, pads):
+        """adds one ring's pads; rings go in from the centre out"""
+        ox, oy = self.origin
+        r = self.pad_radius
+        reach = 0.0
+        nearest = float('inf')
+        keyed = []
+        for pad in pads:
+            dx, dy = pad.x - ox, pad.y - oy
+            d = math.hypot(dx, dy)
+            keyed.append((math.degrees(math.atan2(dy, dx)) % 360.0, pad.index, pad))
+            nearest = min(nearest, d)
+            if d <= r:
+                reach = 180.0
+            else:
+                reach = max(reach, math.degrees(math.asin(r / d)))
+        keyed.sort()
+        band = [k[2] for k in keyed]
+        # a hair wider so the exact test decides the boundary cases
+        self.bands.append(([k[0] for k in keyed], band + band, reach + 1.e-6, nearest))
+
+    def candidates(self, angle, length, found):
+        """fills found with the pads a swipe of length at angle degrees
+        (0 <= angle < 360) might touch; found is the caller's, reused"""
+        del found[:]
+        r = self.pad_radius
+        for angles, ring, reach, nearest in self.bands:
+            if nearest - r > length:
+                continue
+            n = len(angles)
+            if reach >= 180.0:
+                start, stop = 0, n
+            else:
+                lo = angle - reach
+                hi = angle + reach
+                if lo < 0.0:
+                    start, stop = bisect.bisect_left(angles, lo + 360.0), n + bisect.bisect_right(angles, hi)
+                elif hi >= 360.0:
+                    start, stop = bisect.bisect_left(angles, lo), n + bisect.bisect_right(angles, hi - 360.0)
+                else:
+                    start, stop = bisect.bisect_left(angles, lo), bisect.bisect_right(angles, hi)
+            for i in range(start, stop):
+                found.append(ring[i])
+        return found
+
+
+class TimerWheel(object):
+
+    """Timers bucketed by the tick they fall due in
+
+    Entries are [due, seq, fn, pad, alive]. A wheel of one slot per tick
+    holds everything due within len(slots) ticks and a heap the rest, moved
+    onto the wheel as it comes round, so adding is O(1) for all but far off
+    timers. Cancelling only clears alive; the entry is dropped when its slot
+    comes up. Due entries fire in (due, seq) order, the first time now
+    reaches due, whatever the step length.
+    """
+
+    def __init__(self, tick, size=512):
+        self.tick = tick
+        self.size = size
+        self.slots = [[] for _ in range(size)]
+        self.cursor = 0  # tick number of the next slot to empty
+        self.far = []  # heap of entries beyond the wheel
+        self.ready = []  # heap of entries from emptied slots
+        self.seq = 0
+
+    def __len__(self):
+        return sum(len(slot) for slot in self.slots) + len(self.far) + len(self.ready)
+
+    def add(self, due, fn, pad=None):
+        self.seq += 1
+        return self.put([due, self.seq, fn, pad, True])
+
+    def put(self, entry):
+        """files an entry as it is, seq and all; for add and for restoring"""
+        n = int(entry[0] / self.tick)
+        if n < self.cursor:
+            heapq.heappush(self.ready, entry)
+        elif n < self.cursor + self.size:
+            self.slots[n % self.size].append(entry)
+        else:
+            heapq.heappush(self.far, entry)
+        return entry
+
+    def live(self):
+        """the live entries, in the order they will fire"""
+        entries = [e for e in self.ready + self.far if e[4]]
+        for slot in self.slots:
+            if slot:
+                entries.extend([e for e in slot if e[4]])
+        entries.sort()  # as on the heaps, seq settles ties before fn is reached
+        return entries
+
+    def clear(self):
+        """drops every timer; entries still held elsewhere are dead"""
+        for slot in self.slots:
+            for entry in slot:
+                entry[4] = False
+            del slot[:]
+        for entry in self.far + self.ready:
+            entry[4] = False
+        del self.far[:]
+        del self.ready[:]
+
+    def next_due(self):
+        """due time of the earliest live timer, or None; left on the wheel"""
+        best = None
+        for entry in self.ready:
+            if entry[4] and (best is None or entry[0] < best):
+                best = entry[0]
+        tick, size, slots = self.tick, self.size, self.slots
+        # a slot's entries all fall due before the next slot's
+        for n in range(self.cursor, self.cursor + size):
+            if best is not None and n * tick > best:
+                return best
+            for entry in slots[n % size]:
+                if entry[4] and (best is None or entry[0] < best):
+                    best = entry[0]
+        if best is None:
+            for entry in self.far:
+                if entry[4] and (best is None or entry[0] < best):
+                    best = entry[0]
+        return best
+
+    def pop(self, now):
+        """the next live entry due by now, taken off the wheel, or None"""
+        tick, size, slots = self.tick, self.size, self.slots
+        last = int(now / tick)
+        while self.cursor <= last:
+            slot = slots[self.cursor % size]
+            for entry in slot:
+                if entry[4]:
+                    heapq.heappush(self.ready, entry)
+            del slot[:]
+            self.cursor += 1
+            far = self.far
+            while far and int(far[0][0] / tick) < self.cursor + size:
+                entry = heapq.heappop(far)
+                if entry[4]:
+                    n = int(entry[0] / tick)
+                    if n < self.cursor:
+                        heapq.heappush(self.ready, entry)
+                    else:
+                        slots[n % size].append(entry)
+
+        ready = self.ready
+        while ready and ready[0][0] <= now:
+            entry = heapq.heappop(ready)
+            if entry[4]:
+                return entry
+        return None
+
+
+def by_ring(pads):
+    """pads grouped into lists by ring, innermost first"""
+    rings = {}
+    for pad in pads:
+        rings.setdefault(pad.ring, []).append(pad)
+    return [rings[ring] for ring in sorted(rings)]
+
+
+class NextLevel(object):
+
+    """The next level, decided and built ahead of level_launch
+
+    pads is None when the current pads are kept and only reset; otherwise
+    they, their grid and their sweep schedule replace the current ones.
+    """
+
+    def __init__(self, layout=None):
+        self.layout = layout
+        self.pads = None
+        self.padGrid = None
+        self.sweep = None
+        self.padsExclInner = None
+        self.special = []  # indices of the special pads, in pick order
+        self.decided = False  # pads and special pads are all settled
+        self.reset = 0  # kept pads reset so far
+
+
+class Simulation(object):
+
+    """
+    Responsibilities:
+        Generation: random generates a level
+        Play: advances player, pads, radar and timers by fixed steps
+        Level progression.
+
+    Anything the view should show is reported through listener(event, *args).
+    """
+
+    def __init__(self, listener=None, seed=None, reuse_level=True, levels=None, level_index=0, rings=None):
+        self.listener = listener
+        # keep the pads of the last level when the layout is unchanged and
+        # only reset their state, instead of building them again
+        self.reuse_level = reuse_level
+        # a levelpack.LevelPack to take levels from, in order from
+        # level_index, instead of generating them
+        self.levels = levels
+        self.level_index = level_index
+        # the next level is prepared a chunk per step by the prepare_level
+        # generator while the game shows messages, so launching it is a swap
+        self.staging = None
+        self.staged = 0  # chunks of it done, so a snapshot can resume it
+        self.nextLevel = None
+        self.launching = False
+        self.rng = random.Random(seed)
+        self.tick = rules['tick']
+        self.time = 0.0
+        self.steps = 0
+
+        # the world grows past its usual size to fit more rings, for the
+        # view to scroll around; the radar grows along to reach them all
+        self.rings = rings if rings is not None else rules['rings']
+        extent = self.rings * rules['ringSpacing'] + rules['padSize']
+        self.width = max(rules['width'], 2.0 * extent)
+        self.height = max(rules['height'], 2.0 * extent)
+        self.swipeLength = max(rules['swipeLength'], math.hypot(extent, extent))
+        self.rPlayer = rules['rPlayer']
+        self.angular_velocity = rules['angular_velocity']
+        self.accel = rules['accel']
+        self.origin = (0.5 * self.width, 0.5 * self.height)
+
+        self.buttons = dict((b, 0) for b in BUTTONS)
+        self.upButtonReleased = True
+
+        # every timed transition, pads' and the ladder's alike
+        self.timers = TimerWheel(self.tick)
+
+        # a hop only ever lands within hopReach of a point, so the lookup
+        # around it touches at most 2x2 cells whatever the level size
+        self.cell_size = 2.0 * rules['hopReach']
+        self.padGrid = PadGrid(self.cell_size)
+        self.nearCells = []  # reused by nearestPad
+        self.swept = []  # reused by updateRadarSwipe
+        self.sweep = SweepSchedule(self.origin, rules['swipePadRadius'])
+
+        self.pads = []
+        self.padsExclInner = []
+        self.layout = None
+        self.player = None
+        self.sparePlayer = None
+        self.level_num = 0
+        self.levels_completed = 0
+        self.levels_lost = 0
+        self.empty_level()
+
+    def emit(self, event, *args):
+        if self.listener is not None:
+            self.listener(event, *args)
+
+    # timers
+
+    def after(self, delay, fn, pad=None):
+        """calls fn(pad), or fn() without a pad, delay seconds from now"""
+        entry = self.timers.add(self.time + delay, fn, pad)
+        if pad is not None:
+            pad.timers.append(entry)
+        return entry
+
+    def cancel_pad_timers(self, pad):
+        for entry in pad.timers:
+            entry[4] = False
+        pad.timers = []
+
+    def run_timers(self):
+        timers = self.timers
+        entry = timers.pop(self.time)
+        while entry is not None:
+            due, seq, fn, pad, alive = entry
+            if pad is None:
+                fn()
+            else:
+                pad.timers.remove(entry)
+                fn(pad)
+            entry = timers.pop(self.time)
+
+    # input
+
+    def set_button(self, name, value):
+        self.buttons[name] = value
+
+    def hop_ready(self):
+        player = self.player
+        return (self.upButtonReleased or player.moveDecay < -rules['hopRepeat']) and not player.disabled
+
+    def hop_now(self):
+        """presses up and, when the rules allow a hop, starts it right away
+        instead of at the next tick, so it moves in that tick already
+
+        For input handlers that want the lowest latency; a hop between
+        ticks can't be recorded as a button change, so replays don't use it.
+        """
+        self.buttons['up'] = 1
+        if self.win_status == 'undecided' and self.hop_ready():
+            self.upButtonReleased = False
+            self.hop()
+
+    # level progression
+
+    def ladder_begin(self):
+        self.level_num = 0
+        self.empty_level()
+        self.stage_level()
+        self.emit('message', GREETING)
+        self.after(rules['messageTime'], self.level_launch)
+
+    def level_launch(self):
+        self.generate_level()
+        self.level_start()
+
+    def level_start(self):
+        self.win_status = 'undecided'
+
+    def level_complete(self):
+        if self.win_status != 'undecided':
+            return
+        self.win_status = 'complete'
+        self.levels_completed += 1
+        for pad in self.pads:
+            self.cancel_pad_timers(pad)
+        self.stage_level()
+        self.emit('level_complete')
+        self.after(rules['celebrationTime'], self.ladder_begin)
+
+    def level_lost(self):
+        self.win_status = 'lost'
+        self.levels_lost += 1
+        self.stage_level()
+        self.emit('message', LOST_MESSAGE)
+        self.after(rules['messageTime'], self.ladder_begin)
+
+    def empty_level(self):
+        # timers belong to the level they were started in; none of them
+        # may call into the next one
+        self.timers.clear()
+        if self.player is not None:
+            self.sparePlayer = self.player
+        self.player = None
+
+        self.specialPads = []
+        self.specialPadMessageDecay = 0.0
+
+        self.swipeDecay = 0.0
+        self.swipeAngle = 0.0
+        self.swipeRevolution = 0
+
+        self.compliments = list(COMPLIMENTS)
+        self.lastCompliment = ""
+
+        self.win_status = 'intermission'  # | 'undecided' | 'complete' | 'lost'
+
+        # player phys params
+        self.topSpeed = rules['topSpeed']
+        self.impulse_x = 0.0
+        self.impulse_y = 1.0
+
+        self.emit('level_cleared')
+
+    def rotatePoint(self, point, origin, angleDeg):
+        #Rotate a point counterclockwise by a given angle around a given origin.
+        return flymath.rotate_point(point[0], point[1], origin[0], origin[1], angleDeg)
+
+    def add_pads(self, origin, padSize, radius, ring, pads):
+        """appends a ring of pads to pads"""
+        circumference = math.pi * 2 * radius
+        numInCircle = int(math.floor(circumference / ((padSize * 2.0) + 2.0)))
+
+        startPoint = (origin[0] + radius, origin[1])
+        for i in range(0, numInCircle):
+            x, y = self.rotatePoint(startPoint, origin, (360 / numInCircle) * (i+1))
+            pads.append(Pad(len(pads), x, y, padSize, ring))
+
+        return pads
+
+    def index_pads(self, level, pads):
+        """gives level pads and builds their grid and sweep schedule,
+        yielding between chunks"""
+        chunk = rules['stageChunk']
+        level.pads = pads
+        level.padsExclInner = [pad for pad in pads if pad.ring > rules['innerRings']]
+        level.padGrid = PadGrid(self.cell_size)
+        for i, pad in enumerate(pads):
+            level.padGrid.insert(pad)
+            if i % chunk == chunk - 1:
+                yield
+        # pads never move, so the radar's sweep order is known up front
+        level.sweep = SweepSchedule(self.origin, rules['swipePadRadius'])
+        done = 0
+        for ring in by_ring(pads):
+            level.sweep.add_ring(ring)
+            done += len(ring)
+            if done >= chunk:
+                done = 0
+                yield
+
+    def set_pads(self, pads, layout):
+        """makes pads, indexed in list order, the pads of the level"""
+        level = NextLevel(layout)
+        for _ in self.index_pads(level, pads):
+            pass
+        self.install_pads(level)
+
+    def install_pads(self, level):
+        self.pads = level.pads
+        self.padGrid = level.padGrid
+        self.sweep = level.sweep
+        self.padsExclInner = level.padsExclInner
+        self.layout = level.layout
+
+    def stage_level(self):
+        """starts preparing the next level unless that is under way"""
+        if self.staging is None:
+            self.staging = self.prepare_level()
+            self.staged = 0
+
+    def prepare_level(self):
+        """builds the next level into nextLevel, yielding between chunks
+
+        Random picks happen in here, at steps the seed decides, so a level
+        comes out the same however the work is spread.
+        """
+        chunk = rules['stageChunk']
+        if self.levels is not None:
+            level = self.nextLevel = NextLevel()
+            index = self.level_index
+            self.level_index = (index + 1) % len(self.levels)
+            for _ in self.levels.prepare(index, self, level):
+                yield
+        else:
+            layout = (rules['padSize'], rules['ringSpacing'], self.rings)
+            level = self.nextLevel = NextLevel(layout)
+            if not (self.reuse_level and self.layout == layout):
+                padSize, radius, rings = layout
+                pads = []
+                done = 0
+                for i in range(1, rings + 1):
+                    self.add_pads(self.origin, padSize, radius * i, i, pads)
+                    if len(pads) - done >= chunk:
+                        done = len(pads)
+                        yield
+                for _ in self.index_pads(level, pads):
+                    yield
+            padsExclInner = self.padsExclInner if level.pads is None else level.padsExclInner
+            if not padsExclInner:
+                raise ValueError("%d rings leave no pads outside the %d inner ones for special pads" % (
+                    layout[2], rules['innerRings']))
+            for i in range(rules['numSpecialPads']):
+                level.special.append(self.rng.choice(padsExclInner).index)
+        level.decided = True
+        for _ in self.finish_level(level):
+            yield
+
+    def finish_level(self, level):
+        """the rest of preparing a decided level; kept pads are reset and
+        new ones announced"""
+        chunk = rules['stageChunk']
+        if level.pads is None:
+            # kept pads are reset once the level they served is cleared
+            # away; level.reset says how far, so this can start over there
+            while self.win_status != 'intermission' and not self.launching:
+                yield
+            pads = self.pads
+            for i in range(level.reset, len(pads)):
+                pads[i].reset()
+                if i % chunk == chunk - 1:
+                    level.reset = i + 1
+                    yield
+            level.reset = len(pads)
+        else:
+            self.emit('level_prepared', level)
+
+    def generate_level(self):
+        origin = self.origin
+        if self.sparePlayer is not None:
+            self.player = self.sparePlayer
+            self.player.reset(origin[0], origin[1])
+        else:
+            self.player = Player(origin[0], origin[1], self.rPlayer)
+
+        # whatever preparing is left happens now
+        self.stage_level()
+        self.launching = True
+        for _ in self.staging:
+            pass
+        self.launching = False
+        self.staging = None
+        level, self.nextLevel = self.nextLevel, None
+
+        reused = level.pads is None
+        if reused:
+            self.layout = level.layout
+        else:
+            self.install_pads(level)
+        for i in level.special:
+            chosenPad = self.pads[i]
+            chosenPad.special = True
+            self.specialPads.append(chosenPad)
+
+        self.emit('level_built', reused)
+
+    # rules
+
+    def nearestPad(self, fx, fy, tx, ty, maxRange, exclPad):
+        """closest usable pad to (tx, ty) within maxRange that lies ahead,
+        seen from (fx, fy) looking at (tx, ty)"""
+        shortest2 = maxRange * maxRange
+        closestPad = None
+
+        dx, dy = tx - fx, ty - fy
+        cosCone = math.cos(math.radians(rules['hopCone']))
+
+        for cell in self.padGrid.cells_around(tx, ty, maxRange, self.nearCells):
+            for pad in cell:
+                if pad is exclPad or pad.disabled or pad.spinning:
+                    continue
+                # check angles to make sure it's ahead of us; a pad right
+                # under us has no direction and never is
+                if flymath.ahead(dx, dy, pad.x - fx, pad.y - fy, cosCone):
+                    distance2 = flymath.dist2(pad.x, pad.y, tx, ty)
+                    # ties go to the pad added first, as in a full scan
+                    if distance2 < shortest2 or (
+                            distance2 == shortest2 and closestPad is not None and pad.index < closestPad.index):
+                        shortest2 = distance2
+                        closestPad = pad
+
+        return closestPad
+
+    def startPadJitter(self, pad):
+        if self.player.currentPad is pad:
+            self.emit('pad_jitter', pad)
+            self.after(rules['collapseDelay'], self.endDisablePad, pad)
+
+    def endDisablePad(self, pad):
+        pad.disabled = True
+        self.emit('pad_collapse', pad)
+
+        if self.player.currentPad is pad and not self.player.invincible:
+            self.player.currentPad = None
+            self.player.disabled = True
+            self.emit('player_fall')
+            self.after(rules['fallTime'], self.level_lost)
+
+    def time_left(self, pad, fn):
+        """seconds until pad's timer calling fn is due, None without one"""
+        for entry in pad.timers:
+            if entry[2] == fn and entry[4]:
+                return entry[0] - self.time
+        return None
+
+    def enablePad(self, pad):
+        pad.disabled = False
+
+    def stopPadSpinning(self, pad):
+        pad.spinning = False
+
+    def showMessageOnPad(self, pad):
+        if not self.compliments:
+            self.compliments = list(COMPLIMENTS)
+        self.lastCompliment = self.rng.choice(self.compliments)
+        self.compliments.remove(self.lastCompliment)
+        self.emit('compliment', pad, self.lastCompliment)
+
+    def updateSpecialPads(self, dt):
+        # check distances to the special pads
+        if self.specialPadMessageDecay > 0.0:
+            self.specialPadMessageDecay -= dt
+            return
+
+        player = self.player
+        specialRange = rules['specialRange']
+        for p in self.specialPads:
+            if not p.specialTriggered:
+                if flymath.within(p.x, p.y, player.x, player.y, specialRange):
+                    self.showMessageOnPad(p)
+                    self.specialPadMessageDecay = rules['specialMessageDecay']
+                    break
+
+    def updateRadarSwipe(self, dt):
+        self.swipeDecay -= dt
+        if self.swipeDecay >= 0.0:
+            return
+
+        self.swipeDecay = rules['swipeInterval']
+        self.swipeAngle -= rules['swipeStep']
+        if self.swipeAngle < 0:
+            self.swipeAngle += 360
+            # every live pad may spin once per revolution
+            self.swipeRevolution += 1
+
+        ox, oy = self.origin
+        a = math.radians(self.swipeAngle)
+        ca, sa = math.cos(a), math.sin(a)
+        length = self.swipeLength
+        r = rules['swipePadRadius']
+        r2 = r * r
+        revolution = self.swipeRevolution
+
+        for pad in self.sweep.candidates(self.swipeAngle, length, self.swept):
+            if pad.sweptRevolution == revolution or pad.disabled or pad.specialTriggered:
+                continue
+            px, py = pad.x - ox, pad.y - oy
+            # closest point on the swipe segment to the pad centre
+            along = min(max(px * ca + py * sa, 0.0), length)
+            if flymath.dist2(px, py, along * ca, along * sa) <= r2:
+                pad.sweptRevolution = revolution
+                pad.spinning = True
+                self.emit('pad_spin', pad)
+                self.after(rules['spinTime'], self.stopPadSpinning, pad)
+
+    def steer(self, dt):
+        buttons = self.buttons
+        ma = buttons['right'] - buttons['left']
+        if ma != 0:
+            self.player.rotation += ma * dt * self.angular_velocity
+            a = math.radians(self.player.rotation)
+            self.impulse_x = math.sin(a)
+            self.impulse_y = math.cos(a)
+
+    def hop(self):
+        player = self.player
+        moveDuration = rules['hopDuration']
+        player.moveDecay = moveDuration
+
+        reach = rules['hopReach']
+        x1 = player.x + self.impulse_x * reach
+        y1 = player.y + self.impulse_y * reach
+
+        nearestPad = self.nearestPad(player.x, player.y, x1, y1, reach, player.currentPad)
+        if nearestPad is not None:
+            x1, y1 = nearestPad.x, nearestPad.y
+            player.currentPad = nearestPad
+
+            if nearestPad.special:
+                if not nearestPad.specialTriggered:
+                    nearestPad.specialTriggered = True
+                    self.emit('special_triggered', nearestPad, self.lastCompliment)
+
+                    padsUntriggered = [p for p in self.specialPads if not p.specialTriggered]
+                    if len(padsUntriggered) == 0:
+                        self.after(rules['completeDelay'], self.level_complete)
+            else:
+                self.after(rules['jitterDelay'], self.startPadJitter, nearestPad)
+        else:
+            player.currentPad = None
+            player.disabled = True
+            self.emit('player_fall')
+            self.after(rules['fallTime'], self.level_lost)
+
+        player.hopping = True
+        player.hop_x0, player.hop_y0 = player.x, player.y
+        player.hop_x1, player.hop_y1 = x1, y1
+        player.hop_elapsed = 0.0
+        player.hop_duration = moveDuration
+        self.emit('hop', nearestPad)
+
+    def updateHop(self, dt):
+        player = self.player
+        player.hop_elapsed += dt
+        if player.hop_elapsed >= player.hop_duration:
+            player.x, player.y = player.hop_x1, player.hop_y1
+            player.hopping = False
+        else:
+            t = player.hop_elapsed / player.hop_duration
+            player.x = player.hop_x0 + (player.hop_x1 - player.hop_x0) * t
+            player.y = player.hop_y0 + (player.hop_y1 - player.hop_y0) * t
+
+    def updatePlayerFlyingWin(self, dt):
+        self.steer(dt)
+        player = self.player
+
+        vx, vy = player.vel_x, player.vel_y
+        if self.buttons['up'] != 0:
+            vx += dt * self.accel * self.impulse_x
+            vy += dt * self.accel * self.impulse_y
+            nv2 = vx * vx + vy * vy
+            if nv2 > self.topSpeed * self.topSpeed:
+                k = self.topSpeed / math.sqrt(nv2)
+                vx *= k
+                vy *= k
+
+        r = player.r
+        # a layout bigger than the screen can leave the player outside the
+        # walls; the flight starts from the nearest point inside them
+        x = min(max(player.x, r), self.width - r)
+        y = min(max(player.y, r), self.height - r)
+        while dt > 1.e-6:
+            nx, ny = x + dt * vx, y + dt * vy
+            consumed_dt = dt
+            # what about screen boundaries ? if colision bounce
+            if nx < r:
+                consumed_dt = (r - x) / vx
+                nx, ny = x + consumed_dt * vx, y + consumed_dt * vy
+                vx = -vx
+            if nx > (self.width - r):
+                consumed_dt = (self.width - r - x) / vx
+                nx, ny = x + consumed_dt * vx, y + consumed_dt * vy
+                vx = -vx
+            if ny < r:
+                consumed_dt = (r - y) / vy
+                nx, ny = x + consumed_dt * vx, y + consumed_dt * vy
+                vy = -vy
+            if ny > (self.height - r):
+                consumed_dt = (self.height - r - y) / vy
+                nx, ny = x + consumed_dt * vx, y + consumed_dt * vy
+                vy = -vy
+            x, y = nx, ny
+            dt -= consumed_dt
+
+        player.vel_x, player.vel_y = vx, vy
+        player.x, player.y = x, y
+
+    def update(self, dt):
+        # if not playing dont update model
+        if self.win_status != 'undecided':
+            if self.win_status == 'complete':
+                self.updatePlayerFlyingWin(dt)
+            return
+
+        self.updateRadarSwipe(dt)
+        self.updateSpecialPads(dt)
+
+        # update player
+        player = self.player
+        self.steer(dt)
+
+        mv = self.buttons['up']
+        if player.moveDecay > -1.0:
+            player.moveDecay -= dt
+
+        if mv == 0 and player.moveDecay < 0.0:
+            self.upButtonReleased = True
+
+        if mv != 0 and self.hop_ready():
+            self.upButtonReleased = False
+            self.hop()
+
+    def step(self, dt=None):
+        """advances the world by dt seconds, one fixed tick if not given"""
+        if dt is None:
+            dt = self.tick
+        self.steps += 1
+        self.time += dt
+        self.run_timers()
+        if self.staging is not None:
+            next(self.staging, None)
+            self.staged += 1
+        if self.player is not None and self.player.hopping:
+            self.updateHop(dt)
+        self.update(dt)
+
+    def next_due(self):
+        """sim time by which something may next happen without input: a
+        timer, a radar swipe or a compliment coming round; None if nothing
+        will. Callers can skip ticks up to it, as long as they run them all.
+        """
+        due = self.timers.next_due()
+        if self.win_status == 'undecided':
+            swipe = self.time + self.swipeDecay
+            if due is None or swipe < due:
+                due = swipe
+            # out of range of them all, the player has to move first
+            player = self.player
+            specialRange = rules['specialRange']
+            for p in self.specialPads:
+                if not p.specialTriggered and flymath.within(p.x, p.y, player.x, player.y, specialRange):
+                    due = min(due, self.time + max(self.specialPadMessageDecay, 0.0))
+                    break
+        return due
+
+    def run(self, seconds, dt=None):
+        if dt is None:
+            dt = self.tick
+        steps = int(round(seconds / dt))
+        for _ in range(steps):
+            self.step(dt)
+        return steps
+
+
+def random_player(sim, dt):
+    """mashes keys; good enough to exercise every rule headless"""
+    rng = sim.rng
+    if rng.random() < 4.0 * dt:
+        turn = rng.choice(('left', 'right', None))
+        sim.set_button('left', turn == 'left')
+        sim.set_button('right', turn == 'right')
+    if rng.random() < 3.0 * dt:
+        sim.set_button('up', 1 - sim.buttons['up'])
+
+
+def main(argv=None):
+    """python flysim.py [seconds] [seed] - headless run with random input"""
+    if argv is None:
+        argv = sys.argv[1:]
+    seconds = float(argv[0]) if len(argv) > 0 else 3600.0
+    seed = int(argv[1]) if len(argv) > 1 else 0
+
+    sim = Simulation(seed=seed)
+    sim.ladder_begin()
+    dt = sim.tick
+    start = time.time()
+    for _ in range(int(round(seconds / dt))):
+        random_player(sim, dt)
+        sim.step(dt)
+    elapsed = time.time() - start
+
+    print("simulated %.0f s in %.2f s (%.0fx realtime)" % (seconds, elapsed, seconds / max(elapsed, 1e-9)))
+    print("levels completed %d, lost %d" % (sim.levels_completed, sim.levels_lost))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+from __future__ import division, print_function, unicode_literals
+
+"""Per-phase frame timing
+
+A Profiler times named phases by swapping timed wrappers in for methods on
+live objects while it is enabled, and taking them out again when it is
+disabled, so a switched off profiler costs nothing. Frames are kept in a
+rolling window for percentiles and, when tracing, row by row for export as
+CSV or JSON.
+"""
+
+import time
+import json
+import collections
+
+clock = time.perf_counter
+
+
+def frame_stats(samples):
+    """mean and percentiles of a list of durations, in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def pct(p):
+        return 1000.0 * ordered[min(n - 1, int(p / 100.0 * n))]
+
+    return {
+        'count': n,
+        'mean': 1000.0 * sum(ordered) / n,
+        'p50': pct(50),
+        'p95': pct(95),
+        'p99': pct(99),
+        'max': 1000.0 * ordered[-1],
+    }
+
+
+def format_stats(stats):
+    return ("%(count)d samples, mean %(mean).3f ms, p50 %(p50).3f, p95 %(p95).3f, "
+            "p99 %(p99).3f, max %(max).3f" % stats)
+
+
+class Profiler(object):
+
+    def __init__(self, window=300):
+        self.enabled = False
+        self.phases = []
+        self.hooks = []  # (obj, method name, phase)
+        self.spent = {}  # phase -> seconds so far this frame
+        self.last = {}  # phase -> seconds in the last finished frame
+        self.frames = collections.deque(maxlen=window)
+        self.frame_num = 0
+        self.trace = None  # rows of [frame, dt, phase seconds...] when tracing
+
+    def watch(self, obj, name, phase=None):
+        """times obj.name() as phase (defaults to name) while enabled"""
+        phase = phase or name
+        if phase not in self.spent:
+            self.phases.append(phase)
+            self.spent[phase] = 0.0
+            self.last[phase] = 0.0
+        hook = (obj, name, phase)
+        self.hooks.append(hook)
+        if self.enabled:
+            self.install(hook)
+
+    def timed(self, phase, fn):
+        spent = self.spent
+
+        def timed_call(*args, **kwargs):
+            start = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                spent[phase] += clock() - start
+        return timed_call
+
+    def install(self, hook):
+        obj, name, phase = hook
+        setattr(obj, name, self.timed(phase, getattr(obj, name)))
+
+    def uninstall(self, hook):
+        obj, name, phase = hook
+        # the wrapper is an instance attribute shadowing the real method
+        if name in obj.__dict__:
+            delattr(obj, name)
+
+    def enable(self):
+        if not self.enabled:
+            self.enabled = True
+            for hook in self.hooks:
+                self.install(hook)
+
+    def disable(self):
+        if self.enabled:
+            self.enabled = False
+            for hook in self.hooks:
+                self.uninstall(hook)
+
+    def start_trace(self):
+        self.trace = []
+        self.enable()
+
+    def frame(self, dt):
+        """closes the current frame, dt being its length"""
+        self.frame_num += 1
+        self.frames.append(dt)
+        spent, last = self.spent, self.last
+        if self.trace is not None:
+            self.trace.append([self.frame_num, dt] + [spent[p] for p in self.phases])
+        for p in self.phases:
+            last[p] = spent[p]
+            spent[p] = 0.0
+
+    def stats(self):
+        return frame_stats(list(self.frames))
+
+    def export(self, path):
+        """writes the trace as JSON if path ends in .json, else CSV"""
+        rows = self.trace or []
+        columns = ['frame', 'dt'] + self.phases
+        with open(path, 'w') as f:
+            if path.endswith('.json'):
+                json.dump({'columns': columns, 'rows': rows, 'stats': self.stats()}, f)
+            else:
+                f.write(','.join(columns) + '\n')
+                for row in rows:
+                    f.write('%d,' % row[0] + ','.join('%.6f' % v for v in row[1:]) + '\n')
+
+
+class Histogram(object):
+
+    """Durations counted in fixed width buckets, the last one open ended"""
+
+    def __init__(self, width=0.004, buckets=25):
+        self.width = width
+        self.counts = [0] * buckets
+        self.samples = []
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.counts[min(len(self.counts) - 1, int(seconds / self.width))] += 1
+
+    def stats(self):
+        return frame_stats(self.samples)
+
+    def format(self, bar=40):
+        """the buckets as text, one per line, from the first to the last
+        one used; summary stats on top"""
+        if not self.samples:
+            return "no samples"
+        lines = [format_stats(self.stats())]
+        used = [i for i, n in enumerate(self.counts) if n]
+        most = max(self.counts)
+        ms = 1000.0 * self.width
+        for i in range(used[0], used[-1] + 1):
+            n = self.counts[i]
+            if i == len(self.counts) - 1:
+                span = "%5.0f+     ms" % (i * ms)
+            else:
+                span = "%5.0f-%-5.0f ms" % (i * ms, (i + 1) * ms)
+            lines.append("%s %-*s %d" % (span, bar, '#' * int(round(bar * n / most)), n))
+        return '\n'.join(lines)
@@ -0,0 +1,179 @@
+from __future__ import division, print_function, unicode_literals
+
+"""Compact binary levels and memory-mapped level packs
+
+A level is a header followed by packed pads and special pad indices, all
+little endian:
+
+    level    padSize f64, ringSpacing f64, rings u16, pads u16, specials u16
+    pad      x f64, y f64, r f64, ring u8, flags u8     (pads times)
+    special  pad index u16                              (specials times)
+
+Positions are kept at full precision, so a level plays exactly as the one
+generated from its seed (and checked by --validate) did.
+
+A pack is a header, an offset table and the levels back to back:
+
+    pack     magic 8s, version u32, levels u32
+    entry    offset u32, size u32                       (levels times)
+
+LevelPack maps the file and reads a level by index straight from it, into
+the simulation's next level; no parsing of the rest of the pack, and no
+new objects when the pads line up with the current ones.
+
+    python levelpack.py build PACK [--seeds N] [--first S] [--validate]
+    python levelpack.py info PACK
+"""
+
+import sys
+import mmap
+import struct
+import argparse
+
+import flysim
+
+MAGIC = b'FLYPACK\x00'
+VERSION = 2
+
+HEADER = struct.Struct('<8sII')
+ENTRY = struct.Struct('<II')
+LEVEL = struct.Struct('<ddHHH')
+PAD = struct.Struct('<dddBB')
+SPECIAL = struct.Struct('<H')
+
+FLAG_SPECIAL = 1
+
+
+def encode_level(sim):
+    """the level sim is playing, as bytes"""
+    padSize, ringSpacing, rings = sim.layout
+    parts = [LEVEL.pack(padSize, ringSpacing, rings, len(sim.pads), len(sim.specialPads))]
+    for pad in sim.pads:
+        parts.append(PAD.pack(pad.x, pad.y, pad.r, pad.ring, FLAG_SPECIAL if pad.special else 0))
+    for pad in sim.specialPads:
+        parts.append(SPECIAL.pack(pad.index))
+    return b''.join(parts)
+
+
+def write_pack(path, levels):
+    """writes encoded levels to a pack at path"""
+    offset = HEADER.size + ENTRY.size * len(levels)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(levels)))
+        for level in levels:
+            f.write(ENTRY.pack(offset, len(level)))
+            offset += len(level)
+        for level in levels:
+            f.write(level)
+
+
+class LevelPack(object):
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("%s is not a version %d level pack" % (path, VERSION))
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.buffer.close()
+
+    def entry(self, index):
+        """offset and size of level index"""
+        if not 0 <= index < self.count:
+            raise IndexError("level %d not in %s (%d levels)" % (index, self.path, self.count))
+        return ENTRY.unpack_from(self.buffer, HEADER.size + ENTRY.size * index)
+
+    def prepare(self, index, sim, level):
+        """fills a flysim.NextLevel with level index, yielding between chunks
+
+        Pads already in the same places are kept: level.pads stays None.
+        """
+        chunk = flysim.rules['stageChunk']
+        buf = self.buffer
+        offset, size = self.entry(index)
+        padSize, ringSpacing, rings, numPads, numSpecials = LEVEL.unpack_from(buf, offset)
+        level.layout = (padSize, ringSpacing, rings)
+        first = offset + LEVEL.size
+
+        pads = sim.pads
+        same = sim.reuse_level and len(pads) == numPads
+        if same:
+            at = first
+            for i, pad in enumerate(pads):
+                x, y, r, ring, flags = PAD.unpack_from(buf, at)
+                if pad.x != x or pad.y != y or pad.r != r or pad.ring != ring:
+                    same = False
+                    break
+                at += PAD.size
+                if i % chunk == chunk - 1:
+                    yield
+
+        if not same:
+            pads = []
+            at = first
+            for i in range(numPads):
+                x, y, r, ring, flags = PAD.unpack_from(buf, at)
+                pads.append(flysim.Pad(i, x, y, r, ring))
+                at += PAD.size
+                if i % chunk == chunk - 1:
+                    yield
+            for _ in sim.index_pads(level, pads):
+                yield
+
+        # the indices carry the pick order; the flags are for other readers
+        at = first + PAD.size * numPads
+        for i in range(numSpecials):
+            level.special.append(SPECIAL.unpack_from(buf, at)[0])
+            at += SPECIAL.size
+
+
+def seeded_level(seed):
+    """the first level the ladder builds for seed, encoded"""
+    sim = flysim.Simulation(seed=seed)
+    sim.generate_level()
+    return encode_level(sim)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Builds and inspects level packs.")
+    commands = parser.add_subparsers(dest='command')
+    build = commands.add_parser('build', help="pack the first level of a run of seeds")
+    build.add_argument('pack')
+    build.add_argument('--seeds', type=int, default=100)
+    build.add_argument('--first', type=int, default=0)
+    build.add_argument('--validate', action='store_true',
+                       help="keep only seeds the analysis bot finishes")
+    info = commands.add_parser('info', help="list the levels in a pack")
+    info.add_argument('pack')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        seeds = range(args.first, args.first + args.seeds)
+        if args.validate:
+            import analyze
+            seeds = [row[0] for row in analyze.analyze(seeds) if row[1] == 'complete']
+        write_pack(args.pack, [seeded_level(seed) for seed in seeds])
+        print("packed %d levels into %s" % (len(seeds), args.pack))
+    elif args.command == 'info':
+        pack = LevelPack(args.pack)
+        for i in range(len(pack)):
+            offset, size = pack.entry(i)
+            padSize, ringSpacing, rings, numPads, numSpecials = LEVEL.unpack_from(pack.buffer, offset)
+            print("%d: %d bytes, %d rings of %g spaced %g, %d pads, %d specials" % (
+                i, size, rings, padSize, ringSpacing, numPads, numSpecials))
+        pack.close()
+    else:
+        parser.print_help()
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
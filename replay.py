@@ -0,0 +1,143 @@
+from __future__ import division, print_function, unicode_literals
+
+"""Input recording and deterministic replay
+
+A log is the RNG seed, the fixed tick and every change of a bound button,
+stamped with the simulation step it applies before:
+
+    fly-replay 1 <seed> <tick>
+    <step> <button> <value>
+    ...
+    end <step>
+
+Stepping a flysim.Simulation with that seed at that tick and feeding the
+changes back in reproduces the session exactly, so a log doubles as a
+benchmark script: python replay.py LOG replays it headless and reports step
+times, fly.py --replay LOG --bench does the same with the window.
+"""
+
+import sys
+import time
+
+import flysim
+from instrument import frame_stats, format_stats
+
+MAGIC = 'fly-replay'
+VERSION = 1
+
+# one letter per button keeps the log short
+codes = {'left': 'L', 'right': 'R', 'up': 'U'}
+names = dict((v, k) for k, v in codes.items())
+
+
+class Recorder(object):
+
+    def __init__(self, path, seed, tick):
+        self.file = open(path, 'w')
+        self.file.write('%s %d %d %r\n' % (MAGIC, VERSION, seed, tick))
+        self.buttons = {}
+
+    def button(self, step, name, value):
+        value = int(bool(value))
+        if self.buttons.get(name) == value:
+            return
+        self.buttons[name] = value
+        self.file.write('%d %s %d\n' % (step, codes[name], value))
+
+    def close(self, step):
+        if self.file is not None:
+            self.file.write('end %d\n' % step)
+            self.file.close()
+            self.file = None
+
+
+class Replay(object):
+
+    def __init__(self, seed, tick, events, end):
+        self.seed = seed
+        self.tick = tick
+        self.events = events  # [(step, name, value)] in step order
+        self.end = end
+        self.next = 0
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.parse(f, path)
+
+    @classmethod
+    def parse(cls, lines, name='log'):
+        """a replay from the lines of a log; name is for the error"""
+        lines = iter(lines)
+        header = next(lines, '').split()
+        if len(header) != 4 or header[0] != MAGIC or int(header[1]) != VERSION:
+            raise ValueError("%s is not a version %d replay" % (name, VERSION))
+        seed, tick = int(header[2]), float(header[3])
+        events = []
+        end = None
+        for line in lines:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == 'end':
+                end = int(fields[1])
+                break
+            events.append((int(fields[0]), names[fields[1]], int(fields[2])))
+        if end is None:
+            # recording was cut short, play what there is
+            end = events[-1][0] if events else 0
+        return cls(seed, tick, events, end)
+
+    def dumps(self):
+        """the log as a Recorder would have written it"""
+        lines = ['%s %d %d %r' % (MAGIC, VERSION, self.seed, self.tick)]
+        lines.extend('%d %s %d' % (step, codes[name], value) for step, name, value in self.events)
+        lines.append('end %d' % self.end)
+        return '\n'.join(lines) + '\n'
+
+    def rewind(self):
+        self.next = 0
+
+    def done(self, sim):
+        return sim.steps >= self.end
+
+    def apply(self, sim):
+        """sets the buttons recorded for the step sim is about to take"""
+        events = self.events
+        while self.next < len(events) and events[self.next][0] <= sim.steps:
+            step, name, value = events[self.next]
+            sim.set_button(name, value)
+            self.next += 1
+
+
+def run_headless(replay, listener=None):
+    """replays on a bare Simulation; returns it and the per step times"""
+    sim = flysim.Simulation(listener=listener, seed=replay.seed)
+    sim.ladder_begin()
+    replay.rewind()
+    clock = time.perf_counter
+    samples = []
+    while not replay.done(sim):
+        start = clock()
+        replay.apply(sim)
+        sim.step(replay.tick)
+        samples.append(clock() - start)
+    return sim, samples
+
+
+def main(argv=None):
+    """python replay.py LOG - replays headless and reports step times"""
+    if argv is None:
+        argv = sys.argv[1:]
+    if len(argv) != 1:
+        print(main.__doc__)
+        return 2
+    replay = Replay.load(argv[0])
+    sim, samples = run_headless(replay)
+    print("steps: " + format_stats(frame_stats(samples)))
+    print("levels completed %d, lost %d, sim time %.2f s" % (sim.levels_completed, sim.levels_lost, sim.time))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,504 @@
+from __future__ import division, print_function, unicode_literals
+
+"""Many headless game sessions in one process
+
+    python server.py [--host H] [--port P | --stdin] [--budget FRACTION]
+                     [--max-sessions N] [--stats SECONDS]
+    python server.py --client [--host H] [--port P] [--sessions N]
+                     [--seconds S] [--seed S] [--local]
+
+A Session is a flysim.Simulation of its own, with its own level, pads,
+player, timers and RNG, so any number of them run side by side; a Server
+steps them all once per fixed tick on an asyncio loop, catching up late
+ticks the way the window does and dropping time past max_catch_up.
+
+Clients speak newline delimited JSON, one object per line, over a local TCP
+socket or, with --stdin, stdin and stdout:
+
+    {"op": "open", "seed": 7, "events": ["hop", "level_lost"]}
+        -> {"op": "opened", "id": 1, "seed": 7}
+    {"op": "button", "id": 1, "button": "up", "value": 1}
+    {"op": "close", "id": 1}
+        -> {"op": "closed", "id": 1, "steps": 5400, "completed": 1,
+            "lost": 3, "replay": "<the run as a replay.py log>"}
+    {"op": "stats"}
+        -> {"op": "stats", ...}, see Server.stats
+
+and the server sends {"op": "event", "id": 1, "step": 412, "event": "hop",
+"args": [17]} for the events a session was opened with ("events": true for
+all of them); pads go as their index. A button change applies before the
+session's next tick. The log returned on close replays the run exactly, so
+it can be validated or shown as a ghost with replay.py.
+
+Stepping has a CPU budget, a fraction of the tick: ticks that go over it are
+counted, and new sessions are turned away once the measured cost per session
+says another wouldn't fit. The stats report that cost and how many sessions
+one core steps within the budget; more cores means more server processes.
+
+--client runs a stand-in client: it opens sessions, mashes keys on them like
+flysim.random_player, closes them after a while, checks that every returned
+log replays to the result the server reported and prints the server's stats.
+--local starts a server in the same process to run it against.
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import collections
+
+import flysim
+import replay
+from instrument import frame_stats
+
+PORT = 7771
+
+
+def encode_arg(arg):
+    """an event argument as JSON: pads by index, anything without a plain
+    form as None"""
+    if isinstance(arg, flysim.Pad):
+        return arg.index
+    if arg is None or isinstance(arg, (bool, int, float, str)):
+        return arg
+    return None
+
+
+def encode(message):
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class Session(object):
+
+    """
+    Responsibilities:
+        State: one flysim.Simulation, whose level, pads, player, timers and
+               RNG belong to this session alone
+        Input: button changes, kept against the step they apply before
+        Events: the ones the client opened it with, sent as they happen
+    """
+
+    def __init__(self, id, seed, events=(), send=None):
+        self.id = id
+        self.seed = seed
+        self.events = None if events is True else frozenset(events or ())  # None for all
+        self.send = None
+        self.inputs = []  # [(step, name, value)]
+        self.sim = flysim.Simulation(listener=self.on_event, seed=seed)
+        self.sim.ladder_begin()
+        self.send = send  # the client hears from the first step on
+
+    def on_event(self, event, *args):
+        if self.send is not None and (self.events is None or event in self.events):
+            self.send({'op': 'event', 'id': self.id, 'step': self.sim.steps, 'event': event,
+                       'args': [encode_arg(a) for a in args]})
+
+    def set_button(self, name, value):
+        # 0/1 or a bool, not anything that happens to be truthy
+        if value not in (0, 1) or not isinstance(value, (int, bool)):
+            raise ValueError("button value %r, not 0, 1, true or false" % (value,))
+        value = int(value)
+        if self.sim.buttons[name] == value:
+            return
+        self.inputs.append((self.sim.steps, name, value))
+        self.sim.set_button(name, value)
+
+    def replay(self):
+        """the run so far, as a replay.Replay"""
+        return replay.Replay(self.seed, self.sim.tick, list(self.inputs), self.sim.steps)
+
+
+class Server(object):
+
+    """
+    Responsibilities:
+        Sessions: opens and closes them for clients, each owned by the
+                  connection that opened it and closed along with it
+        Ticks: steps every session once per fixed tick, catching up late
+               ticks up to max_catch_up and dropping time past it
+        Budget: times each tick's stepping against budget * tick, turns new
+                sessions away when they wouldn't fit, and reports the cost
+                per session and sessions per core
+    """
+
+    max_catch_up = 0.25  # seconds
+    max_buffer = 1 << 20  # bytes unsent to a client before it is dropped
+    settle = 60  # ticks
+
+    def __init__(self, budget=0.5, max_sessions=None, window=600):
+        self.tick = flysim.rules['tick']
+        self.budget = budget
+        self.max_sessions = max_sessions
+        self.sessions = collections.OrderedDict()  # id -> Session
+        self.nextId = 1
+        self.running = False
+        self.ticks = 0
+        self.overruns = 0  # ticks whose stepping went over the budget
+        self.dropped = 0  # ticks skipped because the loop fell behind
+        self.refused = 0  # sessions turned away
+        # the last window ticks: seconds stepping and sessions stepped
+        self.costs = collections.deque(maxlen=window)
+        self.counts = collections.deque(maxlen=window)
+
+    # sessions
+
+    def session_cost(self):
+        """mean seconds to step one session once, or None until sessions
+        have run for settle ticks; a session's first step builds its level
+        and costs a hundred later ones, so a shorter run says little"""
+        stepped = sum(self.counts)
+        if sum(1 for n in self.counts if n) < self.settle:
+            return None
+        return sum(self.costs) / stepped
+
+    def fits(self):
+        if self.max_sessions is not None and len(self.sessions) >= self.max_sessions:
+            return False
+        cost = self.session_cost()
+        return cost is None or (len(self.sessions) + 1) * cost <= self.budget * self.tick
+
+    def open(self, seed, events=(), send=None):
+        session = Session(self.nextId, seed, events, send)
+        self.sessions[session.id] = session
+        self.nextId += 1
+        return session
+
+    def close(self, id):
+        return self.sessions.pop(id)
+
+    # ticks
+
+    def step_all(self):
+        clock = time.perf_counter
+        start = clock()
+        for session in self.sessions.values():
+            session.sim.step()
+        cost = clock() - start
+        self.ticks += 1
+        self.costs.append(cost)
+        self.counts.append(len(self.sessions))
+        if cost > self.budget * self.tick:
+            self.overruns += 1
+
+    async def run(self):
+        """steps the sessions at the fixed tick until stop()"""
+        clock = time.perf_counter
+        tick = self.tick
+        self.running = True
+        deadline = clock()
+        while self.running:
+            now = clock()
+            late = now - deadline
+            if late > self.max_catch_up:
+                missed = int(late / tick)
+                self.dropped += missed
+                deadline += missed * tick
+            while deadline <= now:
+                self.step_all()
+                deadline += tick
+            await asyncio.sleep(max(0.0, deadline - clock()))
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        cost = self.session_cost()
+        ticks = frame_stats(list(self.costs))
+        return {
+            'sessions': len(self.sessions),
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'dropped': self.dropped,
+            'refused': self.refused,
+            'budget_ms': 1000.0 * self.budget * self.tick,
+            'tick_ms': dict((k, ticks[k]) for k in ('mean', 'p95', 'max')) if ticks else None,
+            'session_us': 1e6 * cost if cost else None,
+            'sessions_per_core': int(self.budget * self.tick / cost) if cost else None,
+        }
+
+    # clients
+
+    def handle(self, request, owned, send):
+        """carries out one request from a client owning the ids in owned;
+        returns the reply, if there is one"""
+        if not isinstance(request, dict):
+            raise ValueError("a request is a JSON object, not %r" % (request,))
+        op = request.get('op')
+        if op == 'open':
+            if not self.fits():
+                self.refused += 1
+                return {'op': 'error', 'error': 'full'}
+            seed = request.get('seed')
+            if seed is None:
+                seed = random.randrange(2 ** 31)
+            session = self.open(int(seed), request.get('events', ()), send)
+            owned.add(session.id)
+            return {'op': 'opened', 'id': session.id, 'seed': session.seed}
+        if op == 'stats':
+            reply = self.stats()
+            reply['op'] = 'stats'
+            return reply
+        if op not in ('button', 'close'):
+            raise ValueError("unknown op %r" % (op,))
+
+        id = request['id']
+        if id not in owned:
+            raise ValueError("no session %r" % (id,))
+        if op == 'button':
+            name = request['button']
+            if name not in flysim.BUTTONS:
+                raise ValueError("no button %r" % (name,))
+            self.sessions[id].set_button(name, request['value'])
+            return None
+        owned.discard(id)
+        session = self.close(id)
+        sim = session.sim
+        return {'op': 'closed', 'id': id, 'steps': sim.steps, 'completed': sim.levels_completed,
+                'lost': sim.levels_lost, 'replay': session.replay().dumps()}
+
+    async def serve(self, reader, writer):
+        """one client's requests until it goes; its sessions close with it"""
+        transport = getattr(writer, 'transport', None)
+
+        def send(message):
+            if transport is not None and transport.get_write_buffer_size() > self.max_buffer:
+                # not reading: stop queueing for it, readline sees the end
+                transport.abort()
+                return
+            writer.write(encode(message))
+
+        owned = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    reply = self.handle(json.loads(line.decode('utf-8')), owned, send)
+                except (ValueError, KeyError, TypeError) as e:
+                    reply = {'op': 'error', 'error': str(e)}
+                if reply is not None:
+                    send(reply)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for id in owned:
+                self.close(id)
+            writer.close()
+
+    async def listen(self, host, port):
+        """serves clients on a TCP socket; returns the asyncio server"""
+        return await asyncio.start_server(self.serve, host, port)
+
+    async def serve_stdio(self):
+        """serves a single client on stdin and stdout, until stdin ends"""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        try:
+            await self.serve(reader, StdoutWriter())
+        finally:
+            self.stop()
+
+    async def report(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            print(format_stats(self.stats()), file=sys.stderr)
+
+
+class StdoutWriter(object):
+
+    """as much of an asyncio.StreamWriter as serve() needs, over stdout"""
+
+    def write(self, data):
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def format_stats(stats):
+    line = "%(sessions)d sessions, %(ticks)d ticks, %(overruns)d over %(budget_ms).2f ms budget, " \
+           "%(dropped)d dropped, %(refused)d refused" % stats
+    if stats['tick_ms']:
+        line += ", tick mean %(mean).3f ms p95 %(p95).3f max %(max).3f" % stats['tick_ms']
+    if stats['session_us']:
+        line += ", %.1f us per session, %d sessions per core" % (stats['session_us'], stats['sessions_per_core'])
+    return line
+
+
+class StandInClient(object):
+
+    """
+    Responsibilities:
+        Play: opens sessions and presses their buttons at random, at the
+              rates flysim.random_player does, over the protocol
+        Check: replays every log the server returns on close, headless, and
+               compares the outcome with what the server reported
+    """
+
+    def __init__(self, reader, writer, sessions, seconds, seed=0):
+        self.reader = reader
+        self.writer = writer
+        self.count = sessions
+        self.seconds = seconds
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.buttons = {}  # session id -> {button: value}
+        self.opened = 0
+        self.closed = 0
+        self.events = 0
+        self.errors = []
+        self.mismatches = []
+        self.stats = None
+        self.done = asyncio.Event()
+
+    def send(self, message):
+        self.writer.write(encode(message))
+
+    async def receive(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            message = json.loads(line.decode('utf-8'))
+            op = message['op']
+            if op == 'event':
+                self.events += 1
+            elif op == 'opened':
+                self.opened += 1
+                self.buttons[message['id']] = dict((b, 0) for b in flysim.BUTTONS)
+            elif op == 'closed':
+                self.closed += 1
+                self.check(message)
+            elif op == 'stats':
+                self.stats = message
+                self.done.set()
+            elif op == 'error':
+                self.errors.append(message['error'])
+        self.done.set()
+
+    def check(self, closed):
+        run = replay.Replay.parse(closed['replay'].splitlines())
+        sim, _ = replay.run_headless(run)
+        if (sim.steps, sim.levels_completed, sim.levels_lost) != (closed['steps'], closed['completed'], closed['lost']):
+            self.mismatches.append(closed['id'])
+
+    def mash(self, dt):
+        """random_player's presses, for every session"""
+        rng = self.rng
+        for id, buttons in self.buttons.items():
+            if rng.random() < 4.0 * dt:
+                turn = rng.choice(('left', 'right', None))
+                for name in ('left', 'right'):
+                    value = int(turn == name)
+                    if buttons[name] != value:
+                        buttons[name] = value
+                        self.send({'op': 'button', 'id': id, 'button': name, 'value': value})
+            if rng.random() < 3.0 * dt:
+                buttons['up'] = 1 - buttons['up']
+                self.send({'op': 'button', 'id': id, 'button': 'up', 'value': buttons['up']})
+
+    async def run(self):
+        receiving = asyncio.ensure_future(self.receive())
+        for i in range(self.count):
+            self.send({'op': 'open', 'seed': self.seed + i, 'events': ['hop', 'level_complete', 'level_lost']})
+        dt = flysim.rules['tick']
+        end = time.perf_counter() + self.seconds
+        while time.perf_counter() < end:
+            self.mash(dt)
+            await self.writer.drain()
+            await asyncio.sleep(dt)
+        stats = {'op': 'stats'}
+        self.send(stats)  # while every session is still running
+        for id in list(self.buttons):
+            self.send({'op': 'close', 'id': id})
+        self.buttons.clear()
+        await self.writer.drain()
+        await self.done.wait()
+        # the closes were sent after the stats; wait for them too
+        while self.closed < self.opened and not receiving.done():
+            await asyncio.sleep(dt)
+        receiving.cancel()
+        self.writer.close()
+
+    def report(self):
+        print("%d sessions opened, %d closed, %d events, %d errors%s" % (
+            self.opened, self.closed, self.events, len(self.errors),
+            " (%s)" % ', '.join(sorted(set(self.errors))) if self.errors else ''))
+        print("%d logs replayed, %d mismatched" % (self.closed, len(self.mismatches)))
+        if self.stats is not None:
+            print("server: " + format_stats(self.stats))
+        return 1 if self.mismatches or self.closed < self.opened else 0
+
+
+async def run_client(args):
+    server = None
+    if args.local:
+        server = Server(args.budget, args.max_sessions)
+        listening = await server.listen(args.host, args.port)
+        port = listening.sockets[0].getsockname()[1]
+        ticking = asyncio.ensure_future(server.run())
+    else:
+        port = args.port
+    reader, writer = await asyncio.open_connection(args.host, port)
+    client = StandInClient(reader, writer, args.sessions, args.seconds, args.seed)
+    await client.run()
+    if server is not None:
+        server.stop()
+        await ticking
+        listening.close()
+    return client.report()
+
+
+async def run_server(args):
+    server = Server(args.budget, args.max_sessions)
+    if args.stats:
+        asyncio.ensure_future(server.report(args.stats))
+    if args.stdin:
+        asyncio.ensure_future(server.serve_stdio())
+    else:
+        await server.listen(args.host, args.port)
+        print("serving on %s:%d" % (args.host, args.port), file=sys.stderr)
+    await server.run()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs many headless sessions of the game.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--stdin', action='store_true', help="serve one client on stdin and stdout")
+    parser.add_argument('--budget', type=float, default=0.5,
+                        help="fraction of each tick stepping sessions may take")
+    parser.add_argument('--max-sessions', type=int)
+    parser.add_argument('--stats', type=float, metavar='SECONDS',
+                        help="print the stats to stderr this often")
+    parser.add_argument('--client', action='store_true', help="run the stand-in client")
+    parser.add_argument('--sessions', type=int, default=100, help="with --client: sessions to open")
+    parser.add_argument('--seconds', type=float, default=10.0, help="with --client: how long to play")
+    parser.add_argument('--seed', type=int, default=0, help="with --client: seed of the first session")
+    parser.add_argument('--local', action='store_true', help="with --client: start a server in-process")
+    args = parser.parse_args(argv)
+    if args.local and not args.client:
+        parser.error("--local goes with --client")
+    if args.local and args.port == PORT:
+        args.port = 0  # any free port
+
+    try:
+        if args.client:
+            return asyncio.run(run_client(args))
+        return asyncio.run(run_server(args))
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,11 +5,25 @@ Usage:
     python setup.py py2app
 """
 
+import glob
+
 from setuptools import setup
 
 APP = ['fly.py']
-DATA_FILES = ['fly.png', 'circle6.png']
-OPTIONS = {}
+# built by atlas.py from fly.png and circle6.png
+# and any level packs built by levelpack.py
+DATA_FILES = ['atlas.png', 'atlas.json'] + glob.glob('*.pack')
+OPTIONS = {
+    # py2app follows fly.py's imports; these are never reached by the game.
+    # numpy is, when installed: it carries the celebration swarm (swarm.py)
+    'excludes': [
+        'tkinter', 'unittest', 'pydoc', 'distutils', 'lib2to3',
+        'PIL', 'pygame',
+        'cocos.tiles', 'cocos.particle', 'cocos.particle_systems', 'cocos.skeleton', 'cocos.mapcolliders',
+        'pyglet.window.win32', 'pyglet.window.xlib', 'pyglet.canvas.win32', 'pyglet.canvas.xlib',
+        'pyglet.libs.win32', 'pyglet.libs.x11',
+    ],
+}
 
 setup(
     app=APP,
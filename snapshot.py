@@ -0,0 +1,292 @@
+from __future__ import division, print_function, unicode_literals
+
+"""Snapshots of a whole flysim.Simulation in a compact buffer
+
+take(sim) packs everything the game goes on from (the clock, ladder and
+radar state, the player, every pad's flags, the compliments left, pending
+timers, the level being prepared and the RNG) into bytes; restore(sim, data)
+puts a simulation back to it, so stepping on from there, with the same
+input, goes exactly as it went from the snapshot. That is rewinding,
+retrying from before a fall, and branching a search from a state without
+replaying up to it.
+
+A snapshot only restores into a simulation of the same rings. Pads are
+stored by their flags; their positions only when they came from a level
+pack, since generated ones follow from the layout. Timers are stored by the
+method they call, so only the calls in TIMER_CALLS can be pending. A level
+still being prepared is stored once its special pads are picked; before
+that it is prepared again after restoring, as far as it had got, so the
+picks fall on the same step and take the same draws.
+
+All little endian:
+
+    header   magic 8s, version u32
+    sim      see SIM, then the player (PLAYER) if there is one
+    pads     flags u8 (pads times), sweptRevolution i32 (pads times),
+             then x f64, y f64, r f64, ring u16 when stored (pads times)
+    specials pad index u32                                 (specials times)
+    left     COMPLIMENTS index u8                          (compliments times)
+    timers   due f64, seq u32, TIMER_CALLS index u8, pad index i32
+    rng      Mersenne Twister state 625 u32, gauss_next f64 (NaN for None)
+    next     the level being prepared, when it is decided: layout, pad
+             count, pads stored u8, specials, kept pads reset so far, then
+             the pads' positions when stored and the special indices
+"""
+
+import math
+import struct
+from operator import attrgetter
+
+import flysim
+
+MAGIC = b'FLYSNAP\x00'
+VERSION = 1
+
+HEADER = struct.Struct('<8sI')
+SIM = struct.Struct('<IdIIIIHBB3BddiddddbddHIHBIII')
+PLAYER = struct.Struct('<dddddddiBdddddd')
+PAD_PLACE = struct.Struct('<dddH')
+INDEX = struct.Struct('<I')
+COMPLIMENT = struct.Struct('<B')
+TIMER = struct.Struct('<dIBi')
+RNG = struct.Struct('<625Id')
+NEXT = struct.Struct('<ddHIBHI')
+
+STATUSES = ('intermission', 'undecided', 'complete', 'lost')
+TIMER_CALLS = ('level_launch', 'level_complete', 'level_lost', 'ladder_begin',
+               'startPadJitter', 'endDisablePad', 'stopPadSpinning', 'enablePad')
+
+# sim flags
+UP_RELEASED = 1
+HAS_PLAYER = 2
+HAS_LAYOUT = 4
+STAGING = 8
+PADS_STORED = 16
+NEXT_DECIDED = 32
+
+# player flags
+DISABLED = 1
+INVINCIBLE = 2
+HOPPING = 4
+
+# pad flags
+PAD_DISABLED = 1
+PAD_SPECIAL = 2
+PAD_TRIGGERED = 4
+PAD_SPINNING = 8
+
+
+# pad flags back to (disabled, special, specialTriggered, spinning)
+PAD_STATES = tuple((bool(f & PAD_DISABLED), bool(f & PAD_SPECIAL), bool(f & PAD_TRIGGERED),
+                    bool(f & PAD_SPINNING)) for f in range(16))
+
+
+def pack_places(pads):
+    return b''.join(PAD_PLACE.pack(pad.x, pad.y, pad.r, pad.ring) for pad in pads)
+
+
+def unpack_places(buf, at, count):
+    pads = []
+    for i in range(count):
+        x, y, r, ring = PAD_PLACE.unpack_from(buf, at)
+        pads.append(flysim.Pad(i, x, y, r, ring))
+        at += PAD_PLACE.size
+    return pads, at
+
+
+def generated_pads(sim, layout):
+    padSize, radius, rings = layout
+    pads = []
+    for i in range(1, rings + 1):
+        sim.add_pads(sim.origin, padSize, radius * i, i, pads)
+    return pads
+
+
+def take(sim):
+    """the state of sim, as bytes"""
+    stored = sim.levels is not None  # pack levels can't be generated again
+    player = sim.player
+    level = sim.nextLevel
+    decided = sim.staging is not None and level is not None and level.decided
+    level_index = sim.level_index
+    if sim.staging is not None and not decided and stored and sim.staged:
+        # preparing again takes the same pack entry again
+        level_index = (level_index - 1) % len(sim.levels)
+    timers = sim.timers.live()
+    flags = ((UP_RELEASED if sim.upButtonReleased else 0) | (HAS_PLAYER if player is not None else 0) |
+             (HAS_LAYOUT if sim.layout is not None else 0) | (STAGING if sim.staging is not None else 0) |
+             (PADS_STORED if stored else 0) | (NEXT_DECIDED if decided else 0))
+    padSize, ringSpacing, rings = sim.layout or (0.0, 0.0, 0)
+    lastCompliment = flysim.COMPLIMENTS.index(sim.lastCompliment) if sim.lastCompliment else -1
+
+    parts = [HEADER.pack(MAGIC, VERSION), SIM.pack(
+        sim.steps, sim.time, sim.level_num, sim.levels_completed, sim.levels_lost, level_index,
+        sim.rings, STATUSES.index(sim.win_status), flags,
+        sim.buttons['left'], sim.buttons['right'], sim.buttons['up'],
+        sim.swipeDecay, sim.swipeAngle, sim.swipeRevolution, sim.specialPadMessageDecay,
+        sim.topSpeed, sim.impulse_x, sim.impulse_y, lastCompliment,
+        padSize, ringSpacing, rings, len(sim.pads), len(sim.specialPads), len(sim.compliments),
+        len(timers), sim.timers.cursor, sim.staged)]
+    if player is not None:
+        parts.append(PLAYER.pack(
+            player.x, player.y, player.r, player.rotation, player.vel_x, player.vel_y, player.moveDecay,
+            -1 if player.currentPad is None else player.currentPad.index,
+            (DISABLED if player.disabled else 0) | (INVINCIBLE if player.invincible else 0) |
+            (HOPPING if player.hopping else 0),
+            player.hop_x0, player.hop_y0, player.hop_x1, player.hop_y1, player.hop_elapsed, player.hop_duration))
+
+    numPads = len(sim.pads)
+    # the flags are bools, so they shift straight into their bits
+    parts.append(struct.pack('<%dB' % numPads, *[
+        pad.disabled | pad.special << 1 | pad.specialTriggered << 2 | pad.spinning << 3 for pad in sim.pads]))
+    parts.append(struct.pack('<%di' % numPads, *map(attrgetter('sweptRevolution'), sim.pads)))
+    if stored:
+        parts.append(pack_places(sim.pads))
+    parts.extend(INDEX.pack(pad.index) for pad in sim.specialPads)
+    parts.extend(COMPLIMENT.pack(flysim.COMPLIMENTS.index(c)) for c in sim.compliments)
+
+    for due, seq, fn, pad, alive in timers:
+        name = getattr(fn, '__name__', None)
+        if name not in TIMER_CALLS or getattr(fn, '__self__', None) is not sim:
+            raise ValueError("a %r timer can't be stored" % (fn,))
+        parts.append(TIMER.pack(due, seq, TIMER_CALLS.index(name), -1 if pad is None else pad.index))
+    parts.append(INDEX.pack(sim.timers.seq))
+
+    version, state, gauss = sim.rng.getstate()
+    parts.append(RNG.pack(*(state + (float('nan') if gauss is None else gauss,))))
+
+    if decided:
+        padSize, ringSpacing, rings = level.layout
+        pads = level.pads or ()
+        parts.append(NEXT.pack(padSize, ringSpacing, rings, len(pads),
+                               1 if stored and level.pads is not None else 0, len(level.special), level.reset))
+        if stored and level.pads is not None:
+            parts.append(pack_places(pads))
+        parts.extend(INDEX.pack(i) for i in level.special)
+    return b''.join(parts)
+
+
+def restore(sim, data):
+    """puts sim back to the state take() stored in data"""
+    buf = memoryview(data)
+    magic, version = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a version %d snapshot" % VERSION)
+    at = HEADER.size
+    (steps, time, level_num, completed, lost, level_index, rings, status, flags,
+     left, right, up, swipeDecay, swipeAngle, swipeRevolution, messageDecay,
+     topSpeed, impulse_x, impulse_y, lastCompliment,
+     padSize, ringSpacing, layoutRings, numPads, numSpecials, numCompliments,
+     numTimers, cursor, staged) = SIM.unpack_from(buf, at)
+    at += SIM.size
+    if rings != sim.rings:
+        raise ValueError("snapshot of %d rings, simulation of %d" % (rings, sim.rings))
+
+    # the level: the pads in place, then their state
+    sim.timers.clear()
+    layout = (padSize, ringSpacing, layoutRings) if flags & HAS_LAYOUT else None
+    player_at = at
+    if flags & HAS_PLAYER:
+        at += PLAYER.size
+    states = struct.unpack_from('<%dB' % numPads, buf, at)
+    at += numPads
+    revolutions = struct.unpack_from('<%di' % numPads, buf, at)
+    at += 4 * numPads
+    if flags & PADS_STORED:
+        pads, at = unpack_places(buf, at, numPads)
+        same = len(sim.pads) == numPads and all(
+            (p.x, p.y, p.r, p.ring) == (q.x, q.y, q.r, q.ring) for p, q in zip(sim.pads, pads))
+    else:
+        pads = None
+        same = sim.layout == layout and len(sim.pads) == numPads
+    if not same:
+        if pads is None:
+            pads = generated_pads(sim, layout) if layout is not None else []
+        sim.set_pads(pads, layout)
+    sim.layout = layout
+    for pad, state, revolution in zip(sim.pads, states, revolutions):
+        pad.sweptRevolution = revolution
+        pad.disabled, pad.special, pad.specialTriggered, pad.spinning = PAD_STATES[state]
+        if pad.timers:
+            pad.timers = []
+    pads = sim.pads
+
+    sim.specialPads = []
+    for _ in range(numSpecials):
+        sim.specialPads.append(pads[INDEX.unpack_from(buf, at)[0]])
+        at += INDEX.size
+    sim.compliments = []
+    for _ in range(numCompliments):
+        sim.compliments.append(flysim.COMPLIMENTS[COMPLIMENT.unpack_from(buf, at)[0]])
+        at += COMPLIMENT.size
+
+    if flags & HAS_PLAYER:
+        player = sim.player or sim.sparePlayer or flysim.Player(0.0, 0.0, sim.rPlayer)
+        (player.x, player.y, player.r, player.rotation, player.vel_x, player.vel_y, player.moveDecay,
+         current, state, player.hop_x0, player.hop_y0, player.hop_x1, player.hop_y1,
+         player.hop_elapsed, player.hop_duration) = PLAYER.unpack_from(buf, player_at)
+        player.currentPad = None if current < 0 else pads[current]
+        player.disabled = bool(state & DISABLED)
+        player.invincible = bool(state & INVINCIBLE)
+        player.hopping = bool(state & HOPPING)
+        sim.player = player
+    elif sim.player is not None:
+        sim.sparePlayer, sim.player = sim.player, None
+
+    sim.steps, sim.time = steps, time
+    sim.level_num, sim.levels_completed, sim.levels_lost = level_num, completed, lost
+    sim.level_index = level_index
+    sim.win_status = STATUSES[status]
+    sim.upButtonReleased = bool(flags & UP_RELEASED)
+    sim.buttons['left'], sim.buttons['right'], sim.buttons['up'] = left, right, up
+    sim.swipeDecay, sim.swipeAngle, sim.swipeRevolution = swipeDecay, swipeAngle, swipeRevolution
+    sim.specialPadMessageDecay = messageDecay
+    sim.topSpeed, sim.impulse_x, sim.impulse_y = topSpeed, impulse_x, impulse_y
+    sim.lastCompliment = flysim.COMPLIMENTS[lastCompliment] if lastCompliment >= 0 else ""
+
+    # timers go back on the wheel where they were, seq and all, so they
+    # fire in the same order
+    wheel = sim.timers
+    wheel.cursor = cursor
+    for _ in range(numTimers):
+        due, seq, call, pad = TIMER.unpack_from(buf, at)
+        at += TIMER.size
+        entry = wheel.put([due, seq, getattr(sim, TIMER_CALLS[call]), None if pad < 0 else pads[pad], True])
+        if pad >= 0:
+            pads[pad].timers.append(entry)
+    wheel.seq = INDEX.unpack_from(buf, at)[0]
+    at += INDEX.size
+
+    rng = RNG.unpack_from(buf, at)
+    at += RNG.size
+    sim.rng.setstate((3, rng[:-1], None if math.isnan(rng[-1]) else rng[-1]))
+
+    sim.launching = False
+    sim.nextLevel = None
+    sim.staging = None
+    if flags & NEXT_DECIDED:
+        padSize, ringSpacing, nextRings, count, placed, specials, reset = NEXT.unpack_from(buf, at)
+        at += NEXT.size
+        level = flysim.NextLevel((padSize, ringSpacing, nextRings))
+        if placed:
+            nextPads, at = unpack_places(buf, at, count)
+        elif count:
+            nextPads = generated_pads(sim, level.layout)
+        else:
+            nextPads = None
+        for _ in range(specials):
+            level.special.append(INDEX.unpack_from(buf, at)[0])
+            at += INDEX.size
+        if nextPads is not None:
+            for _ in sim.index_pads(level, nextPads):
+                pass
+        level.decided = True
+        level.reset = reset
+        sim.nextLevel = level
+        sim.staging = sim.finish_level(level)
+    elif flags & STAGING:
+        # preparing again, to the same chunk, puts the picks on the same step
+        sim.stage_level()
+        for _ in range(staged):
+            next(sim.staging, None)
+    sim.staged = staged
@@ -0,0 +1,198 @@
+from __future__ import division, print_function, unicode_literals
+
+"""Batched flight for the celebration swarm
+
+A Swarm keeps every fly's position, velocity and turn rate in flat arrays
+and moves them all in one call a frame. Walls are handled by folding: a
+path that runs past a wall is mirrored back into the box, as often as it
+crossed one, which is exactly where sub-stepped bounces would leave it, so
+no fly needs a loop of its own whatever the frame time. quads() writes the
+corners of every fly's sprite into one float buffer for a single vertex
+update.
+
+numpy does all of it in array operations when it is installed; without it
+the same arithmetic runs as plain Python loops over array.array, which is
+good for a couple of hundred flies.
+
+    python swarm.py [flies] [frames]
+
+steps a swarm headless and reports the time per frame.
+"""
+
+import sys
+import math
+import time
+import array
+
+try:
+    import numpy
+except ImportError:  # the loops in PlainSwarm stand in
+    numpy = None
+
+
+class SwarmBase(object):
+
+    def release(self, n, x, y, speed, turn, rng):
+        """adds up to n flies at (x, y), each with a random heading, a
+        speed in speed=(low, high) and a turn rate up to turn either way"""
+        first = self.count
+        last = min(self.capacity, first + n)
+        for i in range(first, last):
+            heading = rng.uniform(0.0, 2.0 * math.pi)
+            v = rng.uniform(*speed)
+            self.x[i] = x
+            self.y[i] = y
+            self.vx[i] = v * math.sin(heading)
+            self.vy[i] = v * math.cos(heading)
+            self.turn[i] = rng.uniform(-turn, turn)
+        self.count = last
+
+
+class ArraySwarm(SwarmBase):
+
+    """
+    Responsibilities:
+        State: position, velocity and turn rate per fly, as numpy arrays
+        Step: turns and moves every fly and folds paths back off the walls
+        Quads: the four corners of each fly's sprite, heading along its
+               velocity, as float32 (x, y) pairs
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.count = 0
+        self.x = numpy.zeros(capacity)
+        self.y = numpy.zeros(capacity)
+        self.vx = numpy.zeros(capacity)
+        self.vy = numpy.zeros(capacity)
+        self.turn = numpy.zeros(capacity)  # radians per second
+        self.vertices = numpy.zeros(capacity * 8, dtype=numpy.float32)
+
+    def clear(self):
+        self.count = 0
+        self.vertices[:] = 0.0
+
+    def step(self, dt, x0, y0, x1, y1):
+        """moves every fly dt seconds inside x0 <= x <= x1, y0 <= y <= y1"""
+        n = self.count
+        if not n:
+            return
+        vx, vy = self.vx[:n], self.vy[:n]
+        a = self.turn[:n] * dt
+        c, s = numpy.cos(a), numpy.sin(a)
+        vx[:], vy[:] = c * vx + s * vy, c * vy - s * vx
+        self.fold(self.x[:n], vx, dt, x0, x1)
+        self.fold(self.y[:n], vy, dt, y0, y1)
+
+    @staticmethod
+    def fold(p, v, dt, low, high):
+        span = high - low
+        u = numpy.mod(p - low + v * dt, 2.0 * span)
+        back = u > span
+        p[:] = low + numpy.where(back, 2.0 * span - u, u)
+        numpy.negative(v, out=v, where=back)
+
+    def quads(self, half_w, half_h, scale_x, scale_y):
+        """corners of each fly's sprite in view units, bottom left first;
+        flies past count get an empty quad"""
+        n = self.count
+        vx, vy = self.vx[:n], self.vy[:n]
+        length = numpy.hypot(vx, vy)
+        length[length == 0.0] = 1.0
+        fx, fy = vx / length, vy / length  # forward
+        x, y = self.x[:n] * scale_x, self.y[:n] * scale_y
+        ax, ay = fy * half_w, -fx * half_w  # right
+        bx, by = fx * half_h, fy * half_h
+        quads = self.vertices[:n * 8].reshape(n, 8)
+        quads[:, 0] = x - ax - bx
+        quads[:, 1] = y - ay - by
+        quads[:, 2] = x + ax - bx
+        quads[:, 3] = y + ay - by
+        quads[:, 4] = x + ax + bx
+        quads[:, 5] = y + ay + by
+        quads[:, 6] = x - ax + bx
+        quads[:, 7] = y - ay + by
+        return self.vertices
+
+
+class PlainSwarm(SwarmBase):
+
+    """ArraySwarm's arithmetic, fly by fly, for when numpy is missing"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.count = 0
+        self.x = array.array('d', bytes(8 * capacity))
+        self.y = array.array('d', bytes(8 * capacity))
+        self.vx = array.array('d', bytes(8 * capacity))
+        self.vy = array.array('d', bytes(8 * capacity))
+        self.turn = array.array('d', bytes(8 * capacity))
+        self.vertices = array.array('f', bytes(4 * 8 * capacity))
+
+    def clear(self):
+        self.count = 0
+        self.vertices[:] = array.array('f', bytes(4 * 8 * self.capacity))
+
+    def step(self, dt, x0, y0, x1, y1):
+        xs, ys, vxs, vys, turns = self.x, self.y, self.vx, self.vy, self.turn
+        sx, sy = x1 - x0, y1 - y0
+        cos, sin = math.cos, math.sin
+        for i in range(self.count):
+            a = turns[i] * dt
+            c, s = cos(a), sin(a)
+            vx, vy = vxs[i], vys[i]
+            vx, vy = c * vx + s * vy, c * vy - s * vx
+            u = (xs[i] - x0 + vx * dt) % (2.0 * sx)
+            if u > sx:
+                u = 2.0 * sx - u
+                vx = -vx
+            xs[i] = x0 + u
+            u = (ys[i] - y0 + vy * dt) % (2.0 * sy)
+            if u > sy:
+                u = 2.0 * sy - u
+                vy = -vy
+            ys[i] = y0 + u
+            vxs[i], vys[i] = vx, vy
+
+    def quads(self, half_w, half_h, scale_x, scale_y):
+        out = self.vertices
+        xs, ys, vxs, vys = self.x, self.y, self.vx, self.vy
+        hypot = math.hypot
+        for i in range(self.count):
+            vx, vy = vxs[i], vys[i]
+            length = hypot(vx, vy) or 1.0
+            fx, fy = vx / length, vy / length
+            x, y = xs[i] * scale_x, ys[i] * scale_y
+            ax, ay = fy * half_w, -fx * half_w
+            bx, by = fx * half_h, fy * half_h
+            j = 8 * i
+            out[j:j + 8] = array.array('f', (
+                x - ax - bx, y - ay - by, x + ax - bx, y + ay - by,
+                x + ax + bx, y + ay + by, x - ax + bx, y - ay + by))
+        return out
+
+
+Swarm = ArraySwarm if numpy is not None else PlainSwarm
+
+
+def main(argv=None):
+    """python swarm.py [flies] [frames] - steps a swarm headless"""
+    import random
+    if argv is None:
+        argv = sys.argv[1:]
+    flies = int(argv[0]) if argv else 1000
+    frames = int(argv[1]) if len(argv) > 1 else 600
+    swarm = Swarm(flies)
+    swarm.release(flies, 200.0, 150.0, (20.0, 60.0), 1.5, random.Random(0))
+    start = time.perf_counter()
+    for _ in range(frames):
+        swarm.step(1.0 / 60.0, 3.0, 3.0, 397.0, 297.0)
+        swarm.quads(6.0, 6.0, 2.0, 2.0)
+    elapsed = time.perf_counter() - start
+    print("%s, %d flies: %.3f ms per frame" % (
+        swarm.__class__.__name__, flies, 1000.0 * elapsed / frames))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
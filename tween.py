@@ -0,0 +1,108 @@
+from __future__ import division, print_function, unicode_literals
+
+"""Flat tween table for the view's per-pad effects
+
+Each running tween is one slot across parallel lists (target index, property,
+start, end, begin time, duration, easing, callback), and step() advances all
+of them in a single loop. Finished slots are swap-removed, so adding and
+finishing a tween are O(1).
+"""
+
+LINEAR = 0
+PINGPONG = 1  # start -> end -> start, like an action followed by its Reverse
+
+
+class Tweener(object):
+
+    def __init__(self, targets=None):
+        self.targets = targets if targets is not None else []
+        self.time = 0.0
+
+        self.target = []
+        self.prop = []
+        self.start = []
+        self.end = []
+        self.begin = []
+        self.duration = []
+        self.easing = []
+        self.callback = []
+
+    def __len__(self):
+        return len(self.target)
+
+    def add(self, target, prop, start, end, duration, delay=0.0, easing=LINEAR, callback=None):
+        """tweens targets[target].prop from start to end once delay has passed
+
+        callback(target) runs when it finishes.
+        """
+        self.target.append(target)
+        self.prop.append(prop)
+        self.start.append(start)
+        self.end.append(end)
+        self.begin.append(self.time + delay)
+        self.duration.append(duration)
+        self.easing.append(easing)
+        self.callback.append(callback)
+
+    def next_change(self):
+        """seconds until a tween next moves its property: 0.0 while any is
+        running, None when there are none"""
+        if not self.begin:
+            return None
+        return max(0.0, min(self.begin) - self.time)
+
+    def clear(self):
+        for column in (self.target, self.prop, self.start, self.end,
+                       self.begin, self.duration, self.easing, self.callback):
+            del column[:]
+
+    def cancel(self, target):
+        """drops every tween on target, leaving it where it is"""
+        i = 0
+        while i < len(self.target):
+            if self.target[i] == target:
+                self.remove(i)
+            else:
+                i += 1
+
+    def remove(self, i):
+        last = len(self.target) - 1
+        for column in (self.target, self.prop, self.start, self.end,
+                       self.begin, self.duration, self.easing, self.callback):
+            column[i] = column[last]
+            column.pop()
+
+    def step(self, dt):
+        self.time = now = self.time + dt
+        targets = self.targets
+        target, prop, start, end = self.target, self.prop, self.start, self.end
+        begin, duration, easing = self.begin, self.duration, self.easing
+
+        # finished tweens first, so a tween taking over the same property
+        # on this frame gets the last word; walking backwards means
+        # swap-removing a slot skips nothing
+        finished = None
+        i = len(target) - 1
+        while i >= 0:
+            if now - begin[i] >= duration[i]:
+                value = start[i] if easing[i] == PINGPONG else end[i]
+                setattr(targets[target[i]], prop[i], value)
+                if self.callback[i] is not None:
+                    if finished is None:
+                        finished = []
+                    finished.append((self.callback[i], target[i]))
+                self.remove(i)
+            i -= 1
+
+        for i in range(len(target)):
+            elapsed = now - begin[i]
+            if elapsed >= 0.0:
+                t = elapsed / duration[i]
+                if easing[i] == PINGPONG:
+                    t = 1.0 - abs(2.0 * t - 1.0)
+                setattr(targets[target[i]], prop[i], start[i] + (end[i] - start[i]) * t)
+
+        # callbacks may add or cancel tweens, so they run after the pass
+        if finished is not None:
+            for callback, t in finished:
+                callback(t)
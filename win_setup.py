@@ -1,11 +1,26 @@
+import glob
+
 import cx_Freeze
 # Change "App" to the name of your python script
 executables = [cx_Freeze.Executable("fly.py")]
-includefiles = ['fly.png', 'circle6.png']
+# built by atlas.py from fly.png and circle6.png
+# and any level packs built by levelpack.py
+includefiles = ['atlas.png', 'atlas.json'] + glob.glob('*.pack')
+
+# cx_Freeze follows fly.py's imports (pyglet's platform modules included),
+# so whole packages aren't forced in; these are never reached by the game.
+# numpy is, when installed: it carries the celebration swarm (swarm.py)
+excludes = [
+    'tkinter', 'unittest', 'pydoc', 'distutils', 'lib2to3',
+    'PIL', 'pygame',
+    'cocos.tiles', 'cocos.particle', 'cocos.particle_systems', 'cocos.skeleton', 'cocos.mapcolliders',
+    'pyglet.window.cocoa', 'pyglet.window.xlib', 'pyglet.canvas.cocoa', 'pyglet.canvas.xlib',
+    'pyglet.libs.darwin', 'pyglet.libs.x11',
+]
 
 cx_Freeze.setup(
     name="Fly",
     version = "1",
-    options={"build_exe": {"packages":["pyglet", "cocos"], "include_files":includefiles}},
+    options={"build_exe": {"excludes": excludes, "include_files":includefiles}},
     executables = executables
-    )
\ No newline at end of file
+    )